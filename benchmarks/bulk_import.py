@@ -0,0 +1,62 @@
+"""
+Scaling of the parallel price list import with the number of parser processes.
+
+Writes synthetic price lists for many shops into a temporary directory and
+imports them once per ``--jobs`` value, each time under fresh shop names.
+Reports goods per second and the speedup over the first value. Needs the
+database configured in ``.env``.
+
+Usage::
+
+    python -m benchmarks.bulk_import --files 50 --goods 5000 --jobs 1 2 4 8 --writers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+
+from benchmarks.data import iter_price_list
+from src.database import engine
+from src.ordering_goods.bulk_import import import_price_lists
+
+
+def write_files(directory: str, files: int, categories: int, goods: int) -> list:
+    tag = uuid.uuid4().hex[:8]
+    paths = []
+    for number in range(files):
+        path = os.path.join(directory, f"shop{number}.yaml")
+        with open(path, "w") as output:
+            output.writelines(iter_price_list(f"bench-{tag}-{number}", categories, goods, seed=number))
+        paths.append(path)
+    return paths
+
+
+async def run(args: argparse.Namespace) -> list:
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        for jobs in args.jobs:
+            paths = write_files(directory, args.files, args.categories, args.goods)
+            bulk = await import_price_lists(paths, jobs=jobs, writers=args.writers)
+            report.append({"jobs": jobs,
+                           "writers": args.writers,
+                           "files": len(bulk.results),
+                           "failures": len(bulk.failures),
+                           "goods": bulk.goods,
+                           "seconds": bulk.seconds,
+                           "goods_per_second": bulk.goods / bulk.seconds,
+                           "speedup": report[0]["seconds"] / bulk.seconds if report else 1.0,
+                           })
+    await engine.dispose()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--goods", type=int, default=5000, help="goods per price list")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--writers", type=int, default=4)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -0,0 +1,117 @@
+"""
+Concurrent checkouts over the same hot SKUs.
+
+Seeds one shop with a few offers and a crowd of buyers whose baskets all
+contain every offer, then checks them out at once. Afterwards it verifies
+that stock never went negative and that exactly the successful orders were
+deducted. Needs the database configured in ``.env``.
+
+Usage::
+
+    python -m benchmarks.checkout_concurrency --buyers 300 --skus 3 --stock 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from src.database import async_session_maker, engine
+from src.db.models import (Category, Contact, Order, OrderItem, OrderStateEnum, Product, ProductInfo, Shop,
+                           User)
+from src.ordering_goods.orders import OutOfStock, checkout
+
+
+async def seed(buyers: int, skus: int, stock: int):
+    tag = uuid.uuid4().hex[:8]
+    async with async_session_maker() as session:
+        category_id = (await session.execute(select(func.coalesce(func.max(Category.id), 0) + 1))).scalar_one()
+        await session.execute(insert(Category).values(id=category_id, name=f"bench-{tag}"))
+        shop_id = (await session.execute(insert(Shop).values(name=f"bench-{tag}").returning(Shop.id))).scalar_one()
+        product_id = (await session.execute(insert(Product).values(name=f"bench-{tag}", category_id=category_id)
+                                            .returning(Product.id))).scalar_one()
+        offers = await session.execute(insert(ProductInfo).values([
+            {"model": f"bench-{tag}", "external_id": number, "product_id": product_id, "shop_id": shop_id,
+             "quantity": stock, "price": 100, "price_rrc": 100}
+            for number in range(skus)
+        ]).returning(ProductInfo.id))
+        offer_ids = offers.scalars().all()
+
+        users = await session.execute(insert(User).values([
+            {"email": f"bench-{tag}-{number}@example.com", "hashed_password": "-",
+             "username": f"bench-{tag}-{number}", "is_active": True, "is_superuser": False, "is_verified": True}
+            for number in range(buyers)
+        ]).returning(User.id))
+        user_ids = users.scalars().all()
+        contacts = await session.execute(insert(Contact).values([{"user_id": user_id, "city": "bench"}
+                                                                 for user_id in user_ids])
+                                         .returning(Contact.id, Contact.user_id))
+        contact_ids = {user_id: contact_id for contact_id, user_id in contacts}
+        orders = await session.execute(insert(Order).values([{"user_id": user_id,
+                                                              "state": OrderStateEnum.BASKET.value}
+                                                             for user_id in user_ids])
+                                       .returning(Order.id))
+        items = []
+        for order_id in orders.scalars():
+            # Random insertion order, checkout must lock offers in a stable order anyway
+            for offer_id in random.sample(offer_ids, len(offer_ids)):
+                items.append({"order_id": order_id, "product_info_id": offer_id, "quantity": 1})
+        await session.execute(insert(OrderItem).values(items))
+        await session.commit()
+    return offer_ids, [(user_id, contact_ids[user_id]) for user_id in user_ids]
+
+
+async def run(buyers: int, skus: int, stock: int) -> dict:
+    offer_ids, buyers_contacts = await seed(buyers, skus, stock)
+    outcome = {"ok": 0, "out_of_stock": 0, "errors": 0}
+    latencies = []
+
+    async def one(user_id: int, contact_id: int):
+        started = time.perf_counter()
+        async with async_session_maker() as session:
+            try:
+                await checkout(session, user_id, contact_id)
+                outcome["ok"] += 1
+            except OutOfStock:
+                outcome["out_of_stock"] += 1
+            except (DBAPIError, PoolTimeoutError):
+                outcome["errors"] += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(user_id, contact_id) for user_id, contact_id in buyers_contacts))
+    elapsed = time.perf_counter() - started
+
+    async with async_session_maker() as session:
+        result = await session.execute(select(ProductInfo.quantity).where(ProductInfo.id.in_(offer_ids)))
+        quantities = result.scalars().all()
+    await engine.dispose()
+
+    latencies.sort()
+    return {"buyers": buyers,
+            "skus": skus,
+            "stock": stock,
+            **outcome,
+            "seconds": elapsed,
+            "checkouts_per_second": buyers / elapsed,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+            "final_quantities": quantities,
+            "consistent": all(quantity == stock - outcome["ok"] for quantity in quantities),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--buyers", type=int, default=300)
+    parser.add_argument("--skus", type=int, default=3)
+    parser.add_argument("--stock", type=int, default=100)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.buyers, args.skus, args.stock))
+    print(json.dumps(result, indent=2))
+    if not result["consistent"] or result["errors"]:
+        raise SystemExit(1)
@@ -0,0 +1,43 @@
+"""Synthetic price lists in the ``data/shop1.yaml`` format."""
+import random
+from typing import Iterator
+
+PARAMETERS = {
+    "Диагональ (дюйм)": ["5.5", "6.1", "6.5", "6.7"],
+    "Встроенная память (Гб)": ["64", "128", "256", "512"],
+    "Цвет": ["черный", "белый", "красный", "синий", "золотистый"],
+    "Разрешение (пикс)": ["1792x828", "2688x1242", "2400x1080"],
+}
+
+
+def iter_price_list(shop: str, categories: int, goods: int, seed: int = 0,
+                    price_factor: float = 1.0) -> Iterator[str]:
+    """
+    Yield the lines of a price list.
+
+    The same ``seed`` always produces the same goods, so two calls that only
+    differ in ``price_factor`` describe a re-sent list with changed prices.
+    """
+    rng = random.Random(seed)
+    yield f"shop: {shop}\n"
+    yield "categories:\n"
+    for category_id in range(1, categories + 1):
+        yield f"  - id: {category_id}\n    name: Категория {category_id}\n"
+    yield "\ngoods:\n"
+    for number in range(goods):
+        category_id = rng.randint(1, categories)
+        price = rng.randint(1000, 200000)
+        yield (f"  - id: {number + 1}\n"
+               f"    category: {category_id}\n"
+               f"    model: bench/model-{number % 5000}\n"
+               f"    name: Товар {number % 20000} категории {category_id}\n"
+               f"    price: {int(price * price_factor)}\n"
+               f"    price_rrc: {price + price // 10}\n"
+               f"    quantity: {rng.randint(0, 50)}\n"
+               f"    parameters:\n")
+        for name, choices in PARAMETERS.items():
+            yield f"      \"{name}\": \"{rng.choice(choices)}\"\n"
+
+
+def price_list(shop: str, categories: int, goods: int, seed: int = 0, price_factor: float = 1.0) -> bytes:
+    return "".join(iter_price_list(shop, categories, goods, seed, price_factor)).encode()
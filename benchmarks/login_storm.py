@@ -0,0 +1,79 @@
+"""
+Event loop responsiveness during a burst of password checks.
+
+A probe coroutine stands in for other endpoints: it wakes up every few
+milliseconds and records how late it was. The storm runs bcrypt
+verifications either inline, the way the stock UserManager does, or on
+the PasswordHasher pool.
+
+Usage::
+
+    python -m benchmarks.login_storm --logins 200 --workers 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from fastapi_users.password import PasswordHelper
+
+from src.auth.password import PasswordHasher
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe(delays: List[float], done: asyncio.Event):
+    while not done.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        delays.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def storm(mode: str, logins: int, workers: int) -> dict:
+    helper = PasswordHelper()
+    hashed = helper.hash("benchmark-password")
+    hasher = PasswordHasher(helper, workers)
+    delays: List[float] = []
+    done = asyncio.Event()
+    probe_task = asyncio.create_task(probe(delays, done))
+    await asyncio.sleep(PROBE_INTERVAL)
+
+    async def login_inline():
+        helper.verify_and_update("benchmark-password", hashed)
+
+    async def login_pool():
+        await hasher.verify_and_update("benchmark-password", hashed)
+
+    login = login_pool if mode == "pool" else login_inline
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    delays.sort()
+    return {"mode": mode,
+            "logins": logins,
+            "logins_per_second": logins / elapsed,
+            "probe_samples": len(delays),
+            "probe_p50_ms": statistics.median(delays) * 1000,
+            "probe_p99_ms": delays[int(len(delays) * 0.99) - 1] * 1000 if delays else None,
+            "probe_max_ms": delays[-1] * 1000 if delays else None,
+            "max_queued": hasher.max_queued,
+            }
+
+
+async def main(logins: int, workers: int):
+    for mode in ("inline", "pool"):
+        result = await storm(mode, logins, workers)
+        print(", ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers))
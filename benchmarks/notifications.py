@@ -0,0 +1,88 @@
+"""
+Notification delivery throughput against a local SMTP stand-in.
+
+Starts a minimal SMTP server on localhost that accepts every message,
+enqueues notifications as fast as the queue takes them and measures how
+long the workers need to deliver all of them.
+
+Usage::
+
+    python -m benchmarks.notifications --messages 5000 --workers 4 --batch-size 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from src.notifications import Notification, NotificationQueue, SMTPSender
+
+
+class SMTPStandIn:
+    """Just enough of SMTP for smtplib to deliver messages."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"220 localhost stand-in\r\n")
+        in_data = False
+        while line := await reader.readline():
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    self.received += 1
+                    writer.write(b"250 OK\r\n")
+                continue
+            command = line[:4].upper()
+            if command == b"DATA":
+                in_data = True
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+
+async def run(messages: int, workers: int, batch_size: int) -> dict:
+    stand_in = SMTPStandIn()
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    queue = NotificationQueue(SMTPSender("127.0.0.1", port), workers=workers, batch_size=batch_size,
+                              enqueue_timeout=1)
+    await queue.start()
+    enqueue_latencies = []
+    started = time.perf_counter()
+    for number in range(messages):
+        enqueue_started = time.perf_counter()
+        await queue.enqueue(Notification(kind="bench", recipient=f"user{number}@example.com",
+                                         subject="Benchmark", body="Hello"))
+        enqueue_latencies.append(time.perf_counter() - enqueue_started)
+    await queue.stop(timeout=600)
+    elapsed = time.perf_counter() - started
+
+    server.close()
+    await server.wait_closed()
+    enqueue_latencies.sort()
+    return {"messages": messages,
+            "workers": workers,
+            "batch_size": batch_size,
+            "delivered": stand_in.received,
+            "seconds": elapsed,
+            "messages_per_second": stand_in.received / elapsed,
+            "enqueue_p99_ms": enqueue_latencies[int(len(enqueue_latencies) * 0.99) - 1] * 1000,
+            **{key: value for key, value in queue.stats().items() if key in ("retried", "failed", "dropped")},
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.messages, args.workers, args.batch_size)), indent=2))
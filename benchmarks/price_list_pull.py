@@ -0,0 +1,114 @@
+"""
+Price list pulling against a local HTTP stand-in.
+
+Serves synthetic price lists for a number of shops from a minimal HTTP
+server on localhost that honours If-None-Match, registers the shops with
+URLs pointing at it and runs three pull rounds: a full one, one where every
+list is unchanged, and one after a single list changed. Needs the database
+configured in ``.env``.
+
+Usage::
+
+    python -m benchmarks.price_list_pull --shops 20 --goods 2000 --concurrency 4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict
+
+from sqlalchemy import insert
+
+from benchmarks.data import price_list
+from src.database import async_session_maker, engine
+from src.db.models import Shop
+from src.ordering_goods.bulk_import import price_list_parser
+from src.ordering_goods.puller import PriceListPuller
+
+
+class HTTPStandIn:
+    """Just enough of HTTP/1.1 for GET with ETags, one request per connection."""
+
+    def __init__(self, documents: Dict[str, bytes]):
+        self.documents = documents
+        self.requests = 0
+        self.not_modified = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request_line = await reader.readline()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        self.requests += 1
+        path = request_line.split()[1].decode()
+        document = self.documents.get(path)
+        if document is None:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        else:
+            etag = f'"{hashlib.blake2b(document, digest_size=8).hexdigest()}"'
+            if headers.get("if-none-match") == etag:
+                self.not_modified += 1
+                writer.write(f"HTTP/1.1 304 Not Modified\r\nETag: {etag}\r\nConnection: close\r\n\r\n".encode())
+            else:
+                writer.write(f"HTTP/1.1 200 OK\r\nETag: {etag}\r\nContent-Type: application/yaml\r\n"
+                             f"Content-Length: {len(document)}\r\nConnection: close\r\n\r\n".encode())
+                writer.write(document)
+        await writer.drain()
+        writer.close()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    tag = uuid.uuid4().hex[:8]
+    names = [f"bench-{tag}-{number}" for number in range(args.shops)]
+    documents = {f"/{name}.yaml": price_list(name, args.categories, args.goods, seed=number)
+                 for number, name in enumerate(names)}
+    stand_in = HTTPStandIn(documents)
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async with async_session_maker() as session:
+        await session.execute(insert(Shop).values([{"name": name, "url": f"http://127.0.0.1:{port}/{name}.yaml"}
+                                                   for name in names]))
+        await session.commit()
+
+    puller = PriceListPuller(async_session_maker, concurrency=args.concurrency, per_host=args.concurrency,
+                             host_delay=0, allow_private=True)
+    rounds = []
+    for label in ("full", "unchanged", "one_changed"):
+        if label == "one_changed":
+            documents[f"/{names[0]}.yaml"] = price_list(names[0], args.categories, args.goods, seed=0,
+                                                        price_factor=1.1)
+        before = {key: value for key, value in puller.stats().items() if key != "shops"}
+        started = time.perf_counter()
+        await puller.pull_all()
+        after = puller.stats()
+        rounds.append({"round": label,
+                       "seconds": time.perf_counter() - started,
+                       **{key: after[key] - before[key] for key in ("fetched", "not_modified", "imported", "failed")},
+                       })
+
+    server.close()
+    await server.wait_closed()
+    await price_list_parser.stop()
+    await engine.dispose()
+    return {"shops": args.shops,
+            "goods": args.goods,
+            "requests": stand_in.requests,
+            "rounds": rounds,
+            "consistent": rounds[1]["not_modified"] == args.shops and rounds[2]["imported"] == 1,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shops", type=int, default=20)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--goods", type=int, default=2000, help="goods per price list")
+    parser.add_argument("--concurrency", type=int, default=4)
+    result = asyncio.run(run(parser.parse_args()))
+    print(json.dumps(result, indent=2))
+    if not result["consistent"]:
+        raise SystemExit(1)
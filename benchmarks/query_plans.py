@@ -0,0 +1,186 @@
+"""
+Query plan regression checks for the hot catalog and order queries.
+
+Seeds synthetic price lists, buyers and orders at a scale where the planner
+prefers indexes over sequential scans, runs ANALYZE and then checks the
+``EXPLAIN`` plan of every key query: the expected index must be used and
+the large tables must not be scanned sequentially. Lookups, the first page
+of the listings and the facet counts are checked. Scans of small tables
+such as ``shop`` and ``category`` are left to the planner.
+Exits non-zero when a plan regressed, so it can gate a deploy. Needs the
+database configured in ``.env`` with all migrations applied.
+
+Usage::
+
+    python -m benchmarks.query_plans --shops 5 --goods 20000 --buyers 2000 --orders 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Set
+
+from sqlalchemy import Select, func, insert, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.data import price_list
+from src.database import async_session_maker, chunked, engine
+from src.db.models import Contact, Order, OrderItem, OrderStateEnum, Product, ProductInfo, ProductParameter, User
+from src.ordering_goods.facets import category_facets_query
+from src.ordering_goods.importer import import_price_list
+from src.ordering_goods.orders import order_history_query
+from src.ordering_goods.utils import search_offers_query
+
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+LARGE_TABLES = {"product_info", "product_parameter", "category_facet", "order", "order_item", "contact"}
+
+
+@dataclass
+class PlanCheck:
+    name: str
+    query: Select
+    indexes: Set[str]
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(session: AsyncSession, query: Select) -> Dict[str, Any]:
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+    return result.scalar_one()[0]["Plan"]
+
+
+def verify(plan: Dict[str, Any], check: PlanCheck) -> Dict[str, Any]:
+    nodes = list(plan_nodes(plan))
+    used = {node["Index Name"] for node in nodes if node["Node Type"] in INDEX_SCANS}
+    seq_scans = sorted({node["Relation Name"] for node in nodes
+                        if node["Node Type"] == "Seq Scan" and node["Relation Name"] in LARGE_TABLES})
+    missing = sorted(check.indexes - used)
+    return {"query": check.name,
+            "ok": not missing and not seq_scans,
+            "indexes_used": sorted(used),
+            "missing_indexes": missing,
+            "seq_scans": seq_scans,
+            "cost": plan["Total Cost"],
+            }
+
+
+async def seed(shops: int, categories: int, goods: int, buyers: int, orders: int) -> Dict[str, int]:
+    tag = uuid.uuid4().hex[:8]
+    for number in range(shops):
+        async with async_session_maker() as session:
+            await import_price_list(session, io.BytesIO(price_list(f"plans-{tag}-{number}", categories, goods,
+                                                                   seed=number)))
+    rng = random.Random(0)
+    async with async_session_maker() as session:
+        offer_ids = (await session.execute(select(ProductInfo.id).where(ProductInfo.quantity > 0)
+                                           .order_by(func.random()).limit(10000))).scalars().all()
+        user_ids = []
+        for chunk in chunked([{"email": f"plans-{tag}-{number}@example.com", "hashed_password": "-",
+                               "username": f"plans-{tag}-{number}", "is_active": True, "is_superuser": False,
+                               "is_verified": True} for number in range(buyers)]):
+            user_ids.extend((await session.execute(insert(User).values(chunk).returning(User.id))).scalars())
+        contact_ids = {}
+        for chunk in chunked([{"user_id": user_id, "city": "plans"} for user_id in user_ids]):
+            result = await session.execute(insert(Contact).values(chunk).returning(Contact.id, Contact.user_id))
+            contact_ids.update({user_id: contact_id for contact_id, user_id in result})
+        now = datetime.utcnow()
+        order_rows = [{"user_id": user_id, "contact_id": contact_ids[user_id], "state": OrderStateEnum.NEW.value,
+                       "dt_at": now - timedelta(minutes=rng.randint(0, 500000))}
+                      for user_id in user_ids for _ in range(orders)]
+        order_ids = []
+        for chunk in chunked(order_rows):
+            order_ids.extend((await session.execute(insert(Order).values(chunk).returning(Order.id))).scalars())
+        items = [{"order_id": order_id, "product_info_id": offer_id, "quantity": rng.randint(1, 3)}
+                 for order_id in order_ids for offer_id in rng.sample(offer_ids, 3)]
+        for chunk in chunked(items):
+            await session.execute(insert(OrderItem).values(chunk))
+        await session.commit()
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+    return {"user_id": user_ids[len(user_ids) // 2], "offer_id": offer_ids[0]}
+
+
+def checks(keys: Dict[str, Any]) -> List[PlanCheck]:
+    return [
+        PlanCheck("cheapest_offer",
+                  select(ProductInfo.id, ProductInfo.price)
+                  .where(ProductInfo.product_id == keys["product_id"], ProductInfo.quantity > 0)
+                  .order_by(ProductInfo.price).limit(1),
+                  {"ix_product_info_in_stock"}),
+        PlanCheck("offer_parameters",
+                  select(ProductParameter.parameter_id, ProductParameter.value)
+                  .where(ProductParameter.product_info_id == keys["offer_id"]),
+                  {"_unique_product_info_parameter"}),
+        PlanCheck("order_history",
+                  order_history_query(keys["user_id"]).limit(20),
+                  {"ix_order_user_dt_at", "unique_order_item"}),
+        PlanCheck("search",
+                  search_offers_query(keys["model"]).limit(50),
+                  {"ix_product_name_trgm", "ix_product_info_model_trgm", "ix_product_parameter_value_trgm"}),
+        PlanCheck("shop_listing",
+                  search_offers_query(shop_id=keys["shop_id"]).limit(50),
+                  set()),
+        PlanCheck("category_listing",
+                  search_offers_query(category_id=keys["category_id"], in_stock=True).limit(50),
+                  set()),
+        PlanCheck("facets",
+                  category_facets_query(keys["category_id"]),
+                  {"category_facet_pkey"}),
+        PlanCheck("filtered_facets",
+                  category_facets_query(keys["category_id"], [(keys["parameter_id"], keys["value"])]),
+                  {"_unique_product_info_parameter"}),
+        PlanCheck("basket",
+                  select(Order.id).where(Order.user_id == keys["user_id"],
+                                         Order.state == OrderStateEnum.BASKET.value),
+                  {"ix_order_user_basket"}),
+        PlanCheck("offer_order_items",
+                  select(OrderItem.order_id, OrderItem.quantity)
+                  .where(OrderItem.product_info_id == keys["offer_id"]),
+                  {"ix_order_item_product_info_id"}),
+        PlanCheck("user_contacts",
+                  select(Contact.id).where(Contact.user_id == keys["user_id"]),
+                  {"ix_contact_user_id"}),
+    ]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    keys = await seed(args.shops, args.categories, args.goods, args.buyers, args.orders)
+    async with async_session_maker() as session:
+        offer = await session.execute(select(ProductInfo.product_id, ProductInfo.model, ProductInfo.shop_id,
+                                             Product.category_id)
+                                      .join(Product, ProductInfo.product_id == Product.id)
+                                      .where(ProductInfo.id == keys["offer_id"]))
+        keys["product_id"], keys["model"], keys["shop_id"], keys["category_id"] = offer.one()
+        parameter = await session.execute(select(ProductParameter.parameter_id, ProductParameter.value)
+                                          .where(ProductParameter.product_info_id == keys["offer_id"])
+                                          .limit(1))
+        keys["parameter_id"], keys["value"] = parameter.one()
+        results = [verify(await explain(session, check.query), check) for check in checks(keys)]
+    await engine.dispose()
+    return {"scale": {"shops": args.shops, "goods": args.goods, "buyers": args.buyers, "orders": args.orders},
+            "checks": results,
+            "ok": all(result["ok"] for result in results),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--goods", type=int, default=20000, help="goods per price list")
+    parser.add_argument("--buyers", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=5, help="orders per buyer")
+    report = asyncio.run(run(parser.parse_args()))
+    print(json.dumps(report, indent=2))
+    if not report["ok"]:
+        raise SystemExit(1)
@@ -0,0 +1,82 @@
+"""
+Serialization cost of catalog pages, per 10k rows.
+
+"before" is what FastAPI does for a route with a ``response_model`` that
+returns plain data: validate the content against the model, run it through
+``jsonable_encoder`` and encode with the stdlib ``json``. "after" is the fast
+path used by ``/shop/all`` and ``/category/all``: the dicts built from rows
+go straight to ``ORJSONResponse``.
+
+Usage::
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.ordering_goods.schemas import CategoryPage, ShopPage
+
+
+def shop_page(rows: int) -> dict:
+    return {"items": [{"id": number,
+                       "name": f"Магазин {number}",
+                       "url": f"https://shop{number}.example.com/price.yaml",
+                       "state": True,
+                       "user_id": number,
+                       "categories": [{"id": category, "name": f"Категория {category}"}
+                                      for category in range(number % 5)],
+                       }
+                      for number in range(rows)],
+            "next_after": rows}
+
+
+def category_page(rows: int) -> dict:
+    return {"items": [{"id": number, "name": f"Категория {number}"} for number in range(rows)],
+            "next_after": rows}
+
+
+async def before(model, page: dict) -> bytes:
+    field = create_response_field(name="response", type_=model)
+    content = await serialize_response(field=field, response_content=page)
+    return JSONResponse(content).body
+
+
+async def after(model, page: dict) -> bytes:
+    return ORJSONResponse(page).body
+
+
+async def measure(path, model, page: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await path(model, page)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+async def main(rows: int, repeat: int):
+    results = []
+    for name, model, page in (("shops", ShopPage, shop_page(rows)), ("categories", CategoryPage, category_page(rows))):
+        slow = await measure(before, model, page, repeat)
+        fast = await measure(after, model, page, repeat)
+        results.append({"listing": name,
+                        "rows": rows,
+                        "before_ms_per_10k": slow / rows * 10000 * 1000,
+                        "after_ms_per_10k": fast / rows * 10000 * 1000,
+                        "speedup": slow / fast,
+                        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
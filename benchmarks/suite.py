@@ -0,0 +1,203 @@
+"""
+Load-test suite for the FastAPI app.
+
+The app is driven in process through httpx's ASGI transport, against the
+database configured in ``.env`` (a local Postgres or anything speaking its
+protocol), so the suite runs fully offline. The database is seeded with
+synthetic price lists first, then every scenario is run with the given
+concurrency. Latency percentiles and throughput are written as JSON so that
+runs on different commits can be compared.
+
+All requests come from one client address, so the auth throttle is relaxed
+for the run to admit every auth request; a throttled request aborts the
+run instead of skewing the latencies.
+
+Usage::
+
+    python -m benchmarks.suite --shops 5 --goods 20000 --requests 500 --output bench.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+# src/main.py imports its siblings as top-level packages
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from benchmarks.data import price_list  # noqa: E402
+from src.auth.throttle import TokenBucketLimiter, auth_throttle  # noqa: E402
+from src.config import AUTH_ACCOUNT_RATE, AUTH_IP_RATE  # noqa: E402
+from src.database import async_session_maker, engine  # noqa: E402
+from src.main import app  # noqa: E402
+from src.notifications import notification_queue  # noqa: E402
+from src.ordering_goods.importer import import_price_list  # noqa: E402
+
+PASSWORD = "benchmark-password"
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+
+    def percentile(share: float) -> float:
+        return latencies[min(int(len(latencies) * share), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    return {"scenario": name,
+            "requests": len(latencies),
+            "errors": errors,
+            "seconds": elapsed,
+            "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            }
+
+
+async def run_scenario(name: str,
+                       request: Callable[[int], Awaitable[httpx.Response]],
+                       requests: int,
+                       concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client_loop():
+        nonlocal errors
+        for number in counter:
+            started = time.perf_counter()
+            response = await request(number)
+            if response.status_code == 429:
+                raise RuntimeError(f"Scenario {name} was throttled: {response.text}")
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started)
+
+
+async def seed(shops: int, categories: int, goods: int, tag: str) -> List[Dict[str, float]]:
+    results = []
+    for number in range(shops):
+        data = price_list(f"bench-{tag}-{number}", categories, goods, seed=number)
+        async with async_session_maker() as session:
+            result = await import_price_list(session, io.BytesIO(data))
+        results.append(result.dict())
+    return results
+
+
+def relax_auth_throttle(requests: int, concurrency: int):
+    """Let the suite's auth requests through, they all share one client address."""
+    auth_throttle.by_ip = TokenBucketLimiter(AUTH_IP_RATE, requests)
+    auth_throttle.by_account = TokenBucketLimiter(AUTH_ACCOUNT_RATE, requests)
+    auth_throttle.max_in_flight = max(auth_throttle.max_in_flight, concurrency)
+
+
+async def main(args: argparse.Namespace) -> dict:
+    tag = uuid.uuid4().hex[:8]
+    # Owner registration and login, then registrations and logins of the scenarios
+    relax_auth_throttle(2 + 2 * args.auth_requests, args.concurrency)
+    await notification_queue.start()
+    seeded = await seed(args.shops, args.categories, args.goods, tag)
+    # The auth cookie is only sent over https
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client, \
+            httpx.AsyncClient(app=app, base_url="https://bench") as owner:
+        await owner.post("/auth/register", json={"email": f"bench-{tag}-owner@example.com",
+                                                 "password": PASSWORD,
+                                                 "username": f"bench-{tag}-owner",
+                                                 "usertype": "shop"})
+        await owner.post("/auth/login", data={"username": f"bench-{tag}-owner@example.com", "password": PASSWORD})
+
+        async def register(number: int) -> httpx.Response:
+            return await client.post("/auth/register", json={"email": f"bench-{tag}-{number}@example.com",
+                                                             "password": PASSWORD,
+                                                             "username": f"bench-{tag}-{number}",
+                                                             "company": "bench",
+                                                             "position": "bench"})
+
+        async def login(number: int) -> httpx.Response:
+            return await client.post("/auth/login", data={"username": f"bench-{tag}-{number}@example.com",
+                                                          "password": PASSWORD})
+
+        async def shops(number: int) -> httpx.Response:
+            return await client.get("/shop/all", params={"limit": 100})
+
+        async def categories(number: int) -> httpx.Response:
+            return await client.get("/category/all", params={"limit": 100})
+
+        etag = (await shops(0)).headers.get("etag", "")
+
+        async def shops_conditional(number: int) -> httpx.Response:
+            return await client.get("/shop/all", params={"limit": 100}, headers={"If-None-Match": etag})
+
+        async def add_shop(number: int) -> httpx.Response:
+            return await client.post("/shop/", json={
+                "name": f"bench-{tag}-add-{number}",
+                "categories": [{"id": 1_000_000 + category, "name": f"bench-{tag}-{category}"}
+                               for category in range(args.shop_categories)],
+            })
+
+        async def import_list(number: int) -> httpx.Response:
+            data = price_list(f"bench-{tag}-import-{number}", args.categories, args.import_goods, seed=number)
+            return await owner.post("/shop/import", files={"price_list": ("price_list.yaml", data)})
+
+        scenarios = [("register", register, args.auth_requests),
+                     ("login", login, args.auth_requests),
+                     ("shop_all", shops, args.requests),
+                     ("category_all", categories, args.requests),
+                     ("shop_all_conditional", shops_conditional, args.requests),
+                     ("add_shop", add_shop, args.write_requests),
+                     ("import", import_list, args.imports),
+                     ]
+        results = []
+        for name, request, requests in scenarios:
+            if name in args.skip:
+                continue
+            results.append(await run_scenario(name, request, requests, args.concurrency))
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    await notification_queue.stop()
+    await engine.dispose()
+    return {"commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "scale": {"shops": args.shops, "categories": args.categories, "goods": args.goods},
+            "concurrency": args.concurrency,
+            "seed": seeded,
+            "scenarios": results,
+            }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shops", type=int, default=5, help="price lists imported before the run")
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--goods", type=int, default=20000, help="goods per seeded price list")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="requests per read scenario")
+    parser.add_argument("--auth-requests", type=int, default=100)
+    parser.add_argument("--write-requests", type=int, default=50)
+    parser.add_argument("--shop-categories", type=int, default=500)
+    parser.add_argument("--imports", type=int, default=3)
+    parser.add_argument("--import-goods", type=int, default=5000)
+    parser.add_argument("--skip", nargs="*", default=[], help="scenario names to skip")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+    report = asyncio.run(main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Report written to {args.output}")
@@ -1,11 +1,14 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from fastapi import Depends, Request
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_users import BaseUserManager, IntegerIDMixin, exceptions, schemas, models
 
 from src.db.models import User
-from src.auth.utils import get_user_db
+from src.auth.password import password_hasher
+from src.auth.utils import get_user_db, invalidate_user
 from src.config import RESET_PASSWORD_TOKEN_SERVER, VERIFICATION_TOKEN_SERVER
+from src.notifications import Notification, notification_queue
 
 
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
@@ -43,7 +46,7 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
             else user_create.create_update_dict_superuser()
         )
         password = user_dict.pop("password")
-        user_dict["hashed_password"] = self.password_helper.hash(password)
+        user_dict["hashed_password"] = await password_hasher.hash(password)
 
         created_user = await self.user_db.create(user_dict)
 
@@ -51,8 +54,51 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
 
         return created_user
 
+    async def authenticate(
+        self, credentials: OAuth2PasswordRequestForm
+    ) -> Optional[models.UP]:
+        """
+        Authenticate and return a user following an email and a password.
+
+        Same as the base implementation, but the password is checked
+        on the password hasher pool instead of the event loop.
+
+        :param credentials: The user credentials.
+        """
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Run the hasher to mitigate timing attack
+            await password_hasher.hash(credentials.password)
+            return None
+
+        verified, updated_password_hash = await password_hasher.verify_and_update(
+            credentials.password, user.hashed_password
+        )
+        if not verified:
+            return None
+        # Update password hash to a more robust one if needed
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+
+        return user
+
+    async def _update(self, user: models.UP, update_dict: Dict[str, Any]) -> models.UP:
+        # Like the base class, a None password leaves the password alone
+        if update_dict.get("password") is not None:
+            update_dict = dict(update_dict)
+            password = update_dict.pop("password")
+            await self.validate_password(password, user)
+            update_dict["hashed_password"] = await password_hasher.hash(password)
+        return await super()._update(user, update_dict)
+
     async def on_after_register(self, user: User, request: Optional[Request] = None):
-        print(f"User {user.id} has registered.")
+        await notification_queue.enqueue(Notification(
+            kind="register",
+            recipient=user.email,
+            subject="Registration",
+            body=f"User {user.username} has registered.",
+        ))
 
     async def on_after_login(
         self, user: User, request: Optional[Request] = None
@@ -66,17 +112,52 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         :param request: Optional FastAPI request that
         triggered the operation, defaults to None.
         """
-        print(f"User {user.username} has logined. {request.cookies}")
+        await notification_queue.enqueue(Notification(
+            kind="login",
+            recipient=user.email,
+            subject="New login",
+            body=f"User {user.username} has logged in.",
+        ))
+
+    async def on_after_update(
+        self, user: User, update_dict: Dict[str, Any], request: Optional[Request] = None
+    ) -> None:
+        invalidate_user(user.id)
+
+    async def on_after_reset_password(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        invalidate_user(user.id)
+
+    async def on_after_verify(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        invalidate_user(user.id)
+
+    async def on_after_delete(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        invalidate_user(user.id)
 
     async def on_after_forgot_password(
         self, user: User, token: str, request: Optional[Request] = None
     ):
-        print(f"User {user.id} has forgot their password. Reset token: {token}")
+        await notification_queue.enqueue(Notification(
+            kind="forgot_password",
+            recipient=user.email,
+            subject="Password reset",
+            body=f"Reset token: {token}",
+        ))
 
     async def on_after_request_verify(
         self, user: User, token: str, request: Optional[Request] = None
     ):
-        print(f"Verification requested for user {user.id}. Verification token: {token}")
+        await notification_queue.enqueue(Notification(
+            kind="request_verify",
+            recipient=user.email,
+            subject="E-mail verification",
+            body=f"Verification token: {token}",
+        ))
 
 
 async def get_user_manager(user_db=Depends(get_user_db)):
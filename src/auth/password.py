@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi_users.password import PasswordHelper, PasswordHelperProtocol
+
+from src.config import PASSWORD_HASH_WORKERS
+
+
+class PasswordHasher:
+    """
+    Run password hashing and verification on a bounded thread pool.
+
+    bcrypt releases the GIL while hashing, so a thread pool keeps the event
+    loop free without the pickling cost of a process pool.
+    """
+
+    def __init__(self, helper: Optional[PasswordHelperProtocol] = None, workers: int = PASSWORD_HASH_WORKERS):
+        self.helper = helper or PasswordHelper()
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.helper.hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._submit(self.helper.verify_and_update, plain_password, hashed_password)
+
+    async def _submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def _call(self, func: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "max_queued": self.max_queued,
+                }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,151 @@
+"""
+Admission control for the password-hashing auth routes.
+
+Every login or registration costs a bcrypt operation, so requests are
+admitted before the handler runs and any hashing starts:
+
+* token buckets per client IP and per account (the e-mail being logged into
+  or registered) limit the rate of attempts;
+* a cap on admitted requests whose handler has not finished yet turns
+  requests away while the hasher pool is saturated.
+
+Rejected requests get a 429 with ``Retry-After``. Behind a reverse proxy the
+client IP is only right with uvicorn's ``--proxy-headers``. Only the routes
+that hash are throttled, see ``throttle_routes``.
+"""
+import math
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.routing import APIRoute
+
+from src.cache import TTLCache
+from src.config import (AUTH_ACCOUNT_BURST, AUTH_ACCOUNT_RATE, AUTH_IP_BURST, AUTH_IP_RATE, AUTH_MAX_IN_FLIGHT,
+                        AUTH_THROTTLE_KEYS)
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets of ``burst`` tokens refilled at ``rate`` tokens per second, one per key.
+
+    A bucket that was left alone long enough to refill completely is the
+    same as a new one, so buckets expire after ``burst / rate`` seconds and
+    at most ``maxsize`` of them are kept.
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = AUTH_THROTTLE_KEYS,
+                 timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.timer = timer
+        self.buckets = TTLCache(maxsize=maxsize, ttl=burst / rate, timer=timer)
+
+    def acquire(self, key: Hashable) -> float:
+        """
+        Take a token for the key.
+
+        :return: 0 if a token was taken, otherwise seconds until one is available.
+        """
+        now = self.timer()
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now))
+            return (1 - tokens) / self.rate
+        self.buckets.set(key, (tokens - 1, now))
+        return 0
+
+
+class AuthThrottle:
+    """
+    Dependency admitting or rejecting requests to the auth routes.
+
+    An admitted request counts as in flight until its handler has finished,
+    so the cap also covers the user lookup that runs before the hashing.
+    """
+
+    def __init__(self,
+                 by_ip: TokenBucketLimiter,
+                 by_account: TokenBucketLimiter,
+                 max_in_flight: int = AUTH_MAX_IN_FLIGHT):
+        self.by_ip = by_ip
+        self.by_account = by_account
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_busy = 0
+        self.rejected_ip = 0
+        self.rejected_account = 0
+
+    async def __call__(self, request: Request) -> AsyncIterator[None]:
+        # Read first: no await between the in-flight check and taking a slot
+        account = await _account(request)
+        if self.in_flight >= self.max_in_flight:
+            self.rejected_busy += 1
+            self._reject("Too many authentication requests in progress", 1)
+        ip = request.client.host if request.client else "unknown"
+        wait = self.by_ip.acquire(ip)
+        if wait:
+            self.rejected_ip += 1
+            self._reject("Too many authentication attempts from this address", wait)
+        if account is not None:
+            wait = self.by_account.acquire(account)
+            if wait:
+                self.rejected_account += 1
+                self._reject("Too many authentication attempts for this account", wait)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _reject(detail: str, retry_after: float):
+        raise HTTPException(status_code=429, detail=detail,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected_busy": self.rejected_busy,
+                "rejected_ip": self.rejected_ip,
+                "rejected_account": self.rejected_account,
+                "max_in_flight": self.max_in_flight,
+                "tracked_ips": len(self.by_ip.buckets),
+                "tracked_accounts": len(self.by_account.buckets),
+                }
+
+
+async def _account(request: Request) -> Optional[str]:
+    """E-mail of a login form or registration body; Starlette caches the parsed body for the route."""
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            body = await request.json()
+            account = body.get("email") if isinstance(body, dict) else None
+        elif content_type.startswith(("application/x-www-form-urlencoded", "multipart/form-data")):
+            account = (await request.form()).get("username")
+        else:
+            return None
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return account.strip().lower() if isinstance(account, str) else None
+
+
+def throttle_routes(router: APIRouter, *paths: str) -> APIRouter:
+    """
+    Add the throttle to the router's routes with the given paths, before the router is included.
+
+    :return: The router, for passing on to ``include_router``.
+    """
+    dependency = Depends(auth_throttle)
+    for route in router.routes:
+        if isinstance(route, APIRoute) and route.path in paths:
+            route.dependencies.append(dependency)
+    return router
+
+
+auth_throttle = AuthThrottle(TokenBucketLimiter(AUTH_IP_RATE, AUTH_IP_BURST),
+                             TokenBucketLimiter(AUTH_ACCOUNT_RATE, AUTH_ACCOUNT_BURST))
@@ -1,13 +1,72 @@
-from typing import Any
+from typing import Any, Optional
+
+import jwt
 from fastapi import Depends, Response
+from fastapi_users import BaseUserManager, exceptions
 from fastapi_users.authentication import CookieTransport, JWTStrategy
+from fastapi_users.jwt import decode_jwt
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
-from src.config import SECRET
+from src.cache import TTLCache
+from src.config import SECRET, USER_CACHE_SIZE, USER_CACHE_TTL
 from src.db.models import User
 from src.database import get_async_session
 
+# Column values of users keyed by (user id, token), so every entry of a user can be dropped on update
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def invalidate_user(user_id: Any):
+    user_id = str(user_id)
+    for key in user_cache.keys():
+        if key[0] == user_id:
+            user_cache.pop(key)
+
+
+class CachedJWTStrategy(JWTStrategy):
+    """
+    JWT strategy that remembers the users resolved from verified tokens.
+
+    The token signature and expiry are still checked on every request,
+    only the ``User`` lookup is skipped on a cache hit. The cache holds
+    column values rather than the instance, which a rollback in the request
+    that loaded it would expire, so every hit builds a fresh ``User``.
+    """
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[User, int]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+        except jwt.PyJWTError:
+            return None
+        user_id = data.get("sub")
+        if user_id is None:
+            return None
+
+        key = (user_id, token)
+        values = user_cache.get(key)
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            # Attach it as persistent without a round trip to the database
+            return await user_manager.user_db.session.merge(user, load=False)
+
+        try:
+            user = await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+        user_cache.set(key, {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        return user
+
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
     yield SQLAlchemyUserDatabase(session, User)
@@ -18,4 +77,4 @@ def get_cookie_transport():
 
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=3600)
@@ -12,3 +12,69 @@ SECRET = os.environ.get("SECRET")
 SECRET_AUTH = os.environ.get("SECRET_AUTH")
 RESET_PASSWORD_TOKEN_SERVER = os.environ.get("RESET_PASSWORD_TOKEN_SERVER")
 VERIFICATION_TOKEN_SERVER = os.environ.get("VERIFICATION_TOKEN_SERVER")
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 2000))
+IMPORT_PARSE_WORKERS = int(os.environ.get("IMPORT_PARSE_WORKERS", os.cpu_count() or 1))
+IMPORT_WRITERS = int(os.environ.get("IMPORT_WRITERS", 4))
+IMPORT_QUEUE_SIZE = int(os.environ.get("IMPORT_QUEUE_SIZE", 8))
+IMPORT_MAX_ATTEMPTS = int(os.environ.get("IMPORT_MAX_ATTEMPTS", 3))
+# Parser processes of every web process, for uploaded and pulled price lists
+IMPORT_SERVER_PARSE_WORKERS = int(os.environ.get("IMPORT_SERVER_PARSE_WORKERS", 2))
+
+CATEGORY_CACHE_TTL = float(os.environ.get("CATEGORY_CACHE_TTL", 300))
+CATEGORY_CACHE_SIZE = int(os.environ.get("CATEGORY_CACHE_SIZE", 10000))
+
+CATALOG_VERSION_TTL = float(os.environ.get("CATALOG_VERSION_TTL", 1))
+
+# Also the longest time changes committed by other processes take to show in the offer index
+OFFER_INDEX_REFRESH_INTERVAL = float(os.environ.get("OFFER_INDEX_REFRESH_INTERVAL", 60))
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 30))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+
+# Token buckets for /auth/login and /auth/register: refill rate per second and size
+AUTH_IP_RATE = float(os.environ.get("AUTH_IP_RATE", 1))
+AUTH_IP_BURST = int(os.environ.get("AUTH_IP_BURST", 20))
+AUTH_ACCOUNT_RATE = float(os.environ.get("AUTH_ACCOUNT_RATE", 0.1))
+AUTH_ACCOUNT_BURST = int(os.environ.get("AUTH_ACCOUNT_BURST", 5))
+AUTH_THROTTLE_KEYS = int(os.environ.get("AUTH_THROTTLE_KEYS", 100000))
+# Admitted login and registration requests still being handled before further ones are turned away
+AUTH_MAX_IN_FLIGHT = int(os.environ.get("AUTH_MAX_IN_FLIGHT", PASSWORD_HASH_WORKERS * 4))
+
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+# Comma separated host[:port] list of streaming replicas of DB_HOST
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 1))
+READ_AFTER_WRITE_WINDOW = int(os.environ.get("READ_AFTER_WRITE_WINDOW", 10))
+
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+SMTP_FROM = os.environ.get("SMTP_FROM", "noreply@localhost")
+NOTIFY_WORKERS = int(os.environ.get("NOTIFY_WORKERS", 4))
+NOTIFY_QUEUE_SIZE = int(os.environ.get("NOTIFY_QUEUE_SIZE", 10000))
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", 50))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 5))
+
+# Pull price lists from Shop.url, enable in a single process of the deployment
+PULL_ENABLED = os.environ.get("PULL_ENABLED", "false").lower() == "true"
+PULL_INTERVAL = float(os.environ.get("PULL_INTERVAL", 3600))
+PULL_CONCURRENCY = int(os.environ.get("PULL_CONCURRENCY", 4))
+PULL_PER_HOST = int(os.environ.get("PULL_PER_HOST", 1))
+PULL_HOST_DELAY = float(os.environ.get("PULL_HOST_DELAY", 1))
+PULL_TIMEOUT = float(os.environ.get("PULL_TIMEOUT", 60))
+PULL_MAX_BYTES = int(os.environ.get("PULL_MAX_BYTES", 200 * 1024 * 1024))
+PULL_MAX_REDIRECTS = int(os.environ.get("PULL_MAX_REDIRECTS", 5))
+# Shop URLs come from users, only pull from private or loopback addresses in development
+PULL_ALLOW_PRIVATE = os.environ.get("PULL_ALLOW_PRIVATE", "false").lower() == "true"
+
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "false").lower() == "true"
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
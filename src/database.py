@@ -1,23 +1,286 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Iterator, List, Optional
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from src.config import DB_USER, DB_HOST, DB_NAME, DB_PASS, DB_PORT
+from src.config import (DB_USER, DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_ECHO, DB_POOL_SIZE,
+                        DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                        DB_STATEMENT_CACHE_SIZE, DB_REPLICA_HOSTS, DB_REPLICA_MAX_LAG,
+                        DB_REPLICA_CHECK_INTERVAL, READ_AFTER_WRITE_WINDOW)
 from src.db.models import Base
 
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# asyncpg refuses statements with more bind parameters than this
+MAX_BIND_PARAMS = 32767
+
+# Seconds the replica is behind, zero when it has replayed everything it received
+REPLICA_LAG_QUERY = text("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                         "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                         ).execution_options(count_query=False)
+# Clients that wrote recently carry this cookie and read from the primary until it expires
+PRIMARY_COOKIE = "db_primary_until"
+
+
+def chunked(rows: List[Dict[str, Any]], size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Split rows into chunks that fit into a single statement."""
+    if not rows:
+        return
+    size = size or MAX_BIND_PARAMS // len(rows[0])
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def replica_url(host: str) -> str:
+    host, _, port = host.partition(":")
+    return f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{host}:{port or DB_PORT}/{DB_NAME}"
+
+
+class PoolMetrics:
+    """Checkout counters of a connection pool, with a window of recent wait times."""
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float, waited: bool):
+        self.checkouts += 1
+        self.waits += waited
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        return {"checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "checkout_avg_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                "checkout_p50_ms": recent[len(recent) // 2] * 1000 if recent else 0.0,
+                "checkout_p95_ms": recent[int(len(recent) * 0.95)] * 1000 if recent else 0.0,
+                "checkout_max_ms": self.max_wait * 1000,
+                }
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that measures how long every checkout takes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        waited = (self.checkedin() == 0
+                  and -1 < self._max_overflow <= self.overflow())
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record(time.perf_counter() - started, waited)
+        return connection
+
+
+def create_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    return create_async_engine(url,
+                               echo=DB_ECHO,
+                               poolclass=InstrumentedPool,
+                               pool_size=DB_POOL_SIZE,
+                               max_overflow=DB_MAX_OVERFLOW,
+                               pool_timeout=DB_POOL_TIMEOUT,
+                               pool_recycle=DB_POOL_RECYCLE,
+                               pool_pre_ping=DB_POOL_PRE_PING,
+                               connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+                               )
+
+
+def pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    pool = engine.sync_engine.pool
+    stats = {"size": pool.size(),
+             "in_use": pool.checkedout(),
+             "idle": pool.checkedin(),
+             "overflow": max(pool.overflow(), 0),
+             }
+    if isinstance(pool, InstrumentedPool):
+        stats.update(pool.metrics.stats())
+    return stats
+
+
+class Replica:
+    """A read replica with its own pool and the last measured replication lag."""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False,
+                                          info={"replica": name})
+        self.lag = float("inf")
+        self.routed = 0
+        self.check_errors = 0
+
+    async def refresh_lag(self, timeout: float):
+        """Measure the lag, a replica that cannot be measured counts as infinitely behind."""
+        try:
+            # A replica that cannot answer within the lag limit is too far behind anyway. The limit
+            # covers connecting too, a dead host would otherwise hang until the driver gives up.
+            self.lag = await asyncio.wait_for(self._measure_lag(), timeout)
+        except (DBAPIError, OSError, PoolTimeoutError, asyncio.TimeoutError):
+            self.lag = float("inf")
+            self.check_errors += 1
+
+    async def _measure_lag(self) -> float:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(REPLICA_LAG_QUERY)
+            return float(result.scalar_one())
+
+
+class ReplicaRouter:
+    """
+    Pick a session maker for read-only work.
+
+    Replicas are tried round-robin; one whose lag exceeds ``max_lag`` is
+    skipped until a later check finds it caught up. Without a usable replica
+    reads fail over to the primary. Lags are measured every
+    ``check_interval`` seconds by a background task, so picking a session
+    maker never waits on a replica.
+    """
+
+    def __init__(self, replicas: List[Replica], primary: sessionmaker, max_lag: float, check_interval: float):
+        self.replicas = replicas
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary_reads = 0
+        self.failovers = 0
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.replicas:
+            return
+        await self.refresh_lags()
+        self._task = asyncio.create_task(self._refresh())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh_lags(self):
+        await asyncio.gather(*(replica.refresh_lag(self.max_lag) for replica in self.replicas))
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.refresh_lags()
+            except Exception:
+                logger.exception("Replica lag check failed, reading from the primary")
+                for replica in self.replicas:
+                    replica.lag = float("inf")
+
+    def session_maker(self) -> sessionmaker:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if replica.lag <= self.max_lag:
+                replica.routed += 1
+                return replica.session_maker
+        if self.replicas:
+            self.failovers += 1
+        self.primary_reads += 1
+        return self.primary
+
+    def stats(self) -> Dict[str, Any]:
+        return {"primary_reads": self.primary_reads,
+                "failovers": self.failovers,
+                "replicas": {replica.name: {"lag_seconds": replica.lag if replica.lag != float("inf") else None,
+                                            "routed": replica.routed,
+                                            "check_errors": replica.check_errors,
+                                            "pool": pool_stats(replica.engine),
+                                            }
+                             for replica in self.replicas},
+                }
+
+
+engine = create_engine()
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+replicas = [Replica(host, create_engine(replica_url(host))) for host in DB_REPLICA_HOSTS]
+replica_router = ReplicaRouter(replicas, async_session_maker, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL)
 
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Session on the primary, for writes and anything that must see them."""
     async with async_session_maker() as session:
+        event.listen(session.sync_session, "after_commit",
+                     lambda _: setattr(request.state, "db_committed", True))
+        yield session
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only routes, on a replica when one is usable.
+
+    Clients that committed something within the last
+    ``READ_AFTER_WRITE_WINDOW`` seconds keep reading from the primary, so
+    they always see their own writes.
+    """
+    try:
+        primary_until = float(request.cookies.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        primary_until = 0
+    if primary_until > time.time():
+        replica_router.primary_reads += 1
+        session_maker = async_session_maker
+    else:
+        session_maker = replica_router.session_maker()
+    async with session_maker() as session:
         yield session
 
 
+@asynccontextmanager
+async def primary_session(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    The session itself when it is on the primary, otherwise a new session on the primary.
+
+    For reads that fill process-wide caches: a replica may not have replayed
+    the commit that just invalidated the cache, and what it returns would
+    then stay cached for the whole TTL.
+    """
+    if "replica" not in session.info:
+        yield session
+    else:
+        async with async_session_maker() as primary:
+            yield primary
+
+
+async def read_after_write_middleware(request: Request, call_next):
+    """Send the primary cookie to clients whose request committed a transaction."""
+    response = await call_next(request)
+    if replicas and getattr(request.state, "db_committed", False):
+        response.set_cookie(PRIMARY_COOKIE, str(int(time.time()) + READ_AFTER_WRITE_WINDOW),
+                            max_age=READ_AFTER_WRITE_WINDOW, httponly=True)
+    return response
+
+
 async def create_db_and_tables():
     async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
@@ -5,7 +5,7 @@ from typing import Optional, List, Literal
 from fastapi_users.db import SQLAlchemyBaseUserTable
 from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyBaseAccessTokenTable
 from pydantic import EmailStr
-from sqlalchemy import TIMESTAMP, Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import TIMESTAMP, BigInteger, Column, Integer, String, Boolean, ForeignKey, Index, text
 from sqlalchemy.orm import declared_attr, relationship
 from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
@@ -54,7 +54,7 @@ class ShopCategory(Base):
     __tablename__ = "shop_category"
 
     shop_id: int = Column(ForeignKey("shop.id", ondelete="cascade"), primary_key=True)
-    category_id: int = Column(ForeignKey("category.id", ondelete="cascade"), primary_key=True)
+    category_id: int = Column(ForeignKey("category.id", ondelete="cascade"), primary_key=True, index=True)
 
 
 class Shop(Base):
@@ -64,7 +64,7 @@ class Shop(Base):
     id: Optional[int] = Column(Integer, primary_key=True, autoincrement=True)
     name: str = Column(String(length=50), unique=True)
     url: str = Column(String)
-    user_id: int = Column(Integer, ForeignKey("user.id", ondelete="cascade"))
+    user_id: int = Column(Integer, ForeignKey("user.id", ondelete="cascade"), index=True)
     user: User = relationship("User", back_populates="shop")
     state: bool = Column(Boolean, default=True)
     products_info: List["ProductInfo"] = relationship("ProductInfo", back_populates="shop")
@@ -95,9 +95,13 @@ class Product(Base):
 
     id: Optional[int] = Column(Integer, primary_key=True)
     name: str = Column(String(length=80))
-    category_id: int = Column(Integer, ForeignKey("category.id", ondelete="cascade"))
+    category_id: int = Column(Integer, ForeignKey("category.id", ondelete="cascade"), index=True)
     category: "Category" = relationship("Category", back_populates="products")
     products_info: List["ProductInfo"] = relationship("ProductInfo", back_populates="product")
+    __table_args__ = (UniqueConstraint('name', 'category_id', name='_unique_product'),
+                      Index('ix_product_name_trgm', 'name',
+                            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+                      )
 
 
 class ProductInfo(Base):
@@ -109,14 +113,21 @@ class ProductInfo(Base):
     external_id: int = Column(Integer)
     product_id: int = Column(Integer, ForeignKey("product.id", ondelete="cascade"))
     product: Product = relationship("Product", back_populates="products_info")
-    shop_id: int = Column(ForeignKey("shop.id"))
+    shop_id: int = Column(ForeignKey("shop.id"), index=True)
     shop: Shop = relationship("Shop", back_populates="products_info")
     quantity: int = Column(Integer)
-    price: int = Column(Integer)
+    price: int = Column(Integer, index=True)
     price_rrc: int = Column(Integer)
+    # Hash of the price list entry this offer was last imported from
+    content_hash: int = Column(BigInteger)
     order_items: List["OrderItem"] = relationship("OrderItem", back_populates="product_info")
     product_parameters: List["ProductParameter"] = relationship("ProductParameter", back_populates="product_info")
     __table_args__ = (UniqueConstraint('product_id', 'shop_id', 'external_id', name='_unique_product_info'),
+                      Index('ix_product_info_model_trgm', 'model',
+                            postgresql_using='gin', postgresql_ops={'model': 'gin_trgm_ops'}),
+                      # Cheapest in-stock offers of a product
+                      Index('ix_product_info_in_stock', 'product_id', 'price',
+                            postgresql_where=text("quantity > 0")),
                       )
     
 
@@ -125,7 +136,7 @@ class Parameter(Base):
     __tablename__ = "parameter"
 
     id: Optional[int] = Column(Integer, primary_key=True)
-    name: str = Column(String(length=40))
+    name: str = Column(String(length=40), unique=True)
     product_parameters: List["ProductParameter"] = relationship("ProductParameter", back_populates="parameter")
 
 
@@ -136,19 +147,41 @@ class ProductParameter(Base):
     id: Optional[int] = Column(Integer, primary_key=True)
     product_info_id: int = Column(Integer, ForeignKey("product_info.id", ondelete="cascade"))
     product_info: ProductInfo = relationship("ProductInfo", back_populates="product_parameters")
-    parameter_id: int = Column(Integer, ForeignKey("parameter.id", ondelete="cascade"))
+    parameter_id: int = Column(Integer, ForeignKey("parameter.id", ondelete="cascade"), index=True)
     parameter: Parameter = relationship("Parameter", back_populates="product_parameters")
     value: str = Column(String(length=100))
     __table_args__ = (UniqueConstraint('product_info_id', 'parameter_id', name='_unique_product_info_parameter'),
+                      Index('ix_product_parameter_value_trgm', 'value',
+                            postgresql_using='gin', postgresql_ops={'value': 'gin_trgm_ops'}),
                       )
 
 
+class CategoryFacet(Base):
+
+    __tablename__ = "category_facet"
+
+    category_id: int = Column(ForeignKey("category.id", ondelete="cascade"), primary_key=True)
+    parameter_id: int = Column(ForeignKey("parameter.id", ondelete="cascade"), primary_key=True)
+    value: str = Column(String(length=100), primary_key=True)
+    count: int = Column(Integer, nullable=False, default=0)
+
+
+class CatalogVersion(Base):
+    """Change counter of a catalog resource, bumped by every transaction that modifies it."""
+
+    __tablename__ = "catalog_version"
+
+    resource: str = Column(String(length=40), primary_key=True)
+    version: int = Column(BigInteger, nullable=False, default=0)
+    updated_at: datetime = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+
+
 class Contact(Base):
 
     __tablename__ = "contact"
 
     id: Optional[int] = Column(Integer, primary_key=True)
-    user_id: int = Column(Integer, ForeignKey("user.id"))
+    user_id: int = Column(Integer, ForeignKey("user.id"), index=True)
     user: User = relationship(User, back_populates="contacts")
     city: str = Column(String(length=50))
     street: str = Column(String(length=100))
@@ -170,6 +203,12 @@ class Order(Base):
     state: str = Column(String(length=10))
     contact_id: int = Column(Integer, ForeignKey("contact.id", ondelete="cascade"))
     order_items: List["OrderItem"] = relationship("OrderItem", back_populates="order")
+    # A user has at most one basket
+    __table_args__ = (Index('ix_order_user_basket', 'user_id', unique=True,
+                            postgresql_where=text("state = 'basket'")),
+                      # Order history, scanned backwards for newest first
+                      Index('ix_order_user_dt_at', 'user_id', 'dt_at', 'id'),
+                      )
 
 
 class OrderItem(Base):
@@ -179,8 +218,10 @@ class OrderItem(Base):
     id: Optional[int] = Column(Integer, primary_key=True)
     order_id: int = Column(Integer, ForeignKey("order.id", ondelete="cascade"))
     order: Order = relationship("Order", back_populates="order_items")
-    product_info_id: int = Column(Integer, ForeignKey("product_info.id", ondelete="cascade"))
+    product_info_id: int = Column(Integer, ForeignKey("product_info.id", ondelete="cascade"), index=True)
     product_info: ProductInfo = relationship("ProductInfo", back_populates="order_items")
     quantity: int = Column(Integer)
-    __table_args__ = (UniqueConstraint('order_id', 'product_info_id', name='unique_order_item'),
+    # Also lets order totals be summed with an index-only scan
+    __table_args__ = (Index('unique_order_item', 'order_id', 'product_info_id', unique=True,
+                            postgresql_include=['quantity']),
                       )
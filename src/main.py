@@ -3,14 +3,76 @@ import uvicorn
 from fastapi import FastAPI, Depends
 from auth.base_config import fastapi_users, auth_backend, current_active_user
 from auth.schemas import UserRead, UserCreate
-from ordering_goods.router import router_shop, router_category
+from ordering_goods.router import router_shop, router_category, router_product, router_order
+from src.auth.throttle import auth_throttle, throttle_routes
+from src.database import async_session_maker, engine, read_after_write_middleware, replica_router, replicas
+from src.metrics import router_metrics
+from src.notifications import notification_queue
+from src.ordering_goods.bulk_import import price_list_parser
+from src.ordering_goods.offer_index import offer_index
+from src.ordering_goods.puller import price_list_puller
+from src.config import PULL_ENABLED
+from src.query_stats import install_query_counter, query_counter_middleware
 from src.db.models import User
 
 app = FastAPI(title="Ordering goods by FastAPI")
 
+install_query_counter(engine)
+for replica in replicas:
+    install_query_counter(replica.engine)
+app.middleware("http")(query_counter_middleware)
+app.middleware("http")(read_after_write_middleware)
+
+
+@app.on_event("startup")
+async def start_notifications():
+    await notification_queue.start()
+
+
+@app.on_event("startup")
+async def start_replica_lag_checks():
+    await replica_router.start()
+
+
+@app.on_event("startup")
+async def load_offer_index():
+    await offer_index.start(async_session_maker)
+
+
+@app.on_event("startup")
+async def start_price_list_puller():
+    if PULL_ENABLED:
+        await price_list_puller.start()
+
+
+@app.on_event("shutdown")
+async def stop_notifications():
+    await notification_queue.stop()
+
+
+@app.on_event("shutdown")
+async def stop_replica_lag_checks():
+    await replica_router.stop()
+
+
+@app.on_event("shutdown")
+async def stop_offer_index():
+    await offer_index.stop()
+
+
+@app.on_event("shutdown")
+async def stop_price_list_puller():
+    await price_list_puller.stop()
+
+
+@app.on_event("shutdown")
+async def stop_price_list_parser():
+    await price_list_parser.stop()
+
 
 app.include_router(
-    fastapi_users.get_auth_router(auth_backend),
+    # Logout does not hash a password
+    throttle_routes(fastapi_users.get_auth_router(auth_backend), "/login"),
     prefix="/auth",
     tags=["Auth"],
 )
@@ -19,6 +81,7 @@ app.include_router(
     fastapi_users.get_register_router(UserRead, UserCreate),
     prefix="/auth",
     tags=["Auth"],
+    dependencies=[Depends(auth_throttle)],
 )
 
 
@@ -29,6 +92,9 @@ def protected_route(user: User = Depends(current_active_user)):
 
 app.include_router(router_shop)
 app.include_router(router_category)
+app.include_router(router_product)
+app.include_router(router_order)
+app.include_router(router_metrics)
 
 if __name__ == "__main__":
     # run app on the host and port
@@ -0,0 +1,72 @@
+from fastapi import APIRouter
+
+from src.auth.password import password_hasher
+from src.auth.throttle import auth_throttle
+from src.auth.utils import user_cache
+from src.database import engine, pool_stats, replica_router
+from src.notifications import notification_queue
+from src.ordering_goods.bulk_import import price_list_parser
+from src.ordering_goods.names import category_names, parameter_names
+from src.ordering_goods.offer_index import offer_index
+from src.ordering_goods.puller import price_list_puller
+from src.query_stats import route_stats
+from src.ordering_goods.utils import category_cache
+
+router_metrics = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+
+@router_metrics.get("/cache")
+async def get_cache_metrics():
+    return {"category": category_cache.stats(),
+            "user": user_cache.stats(),
+            "parameter_names": parameter_names.stats(),
+            "category_names": category_names.stats(),
+            }
+
+
+@router_metrics.get("/password-hasher")
+async def get_password_hasher_metrics():
+    return password_hasher.stats()
+
+
+@router_metrics.get("/auth-throttle")
+async def get_auth_throttle_metrics():
+    return auth_throttle.stats()
+
+
+@router_metrics.get("/db-pool")
+async def get_db_pool_metrics():
+    return pool_stats(engine)
+
+
+@router_metrics.get("/db-replicas")
+async def get_db_replica_metrics():
+    return replica_router.stats()
+
+
+@router_metrics.get("/notifications")
+async def get_notification_metrics():
+    return notification_queue.stats()
+
+
+@router_metrics.get("/offer-index")
+async def get_offer_index_metrics():
+    return offer_index.stats()
+
+
+@router_metrics.get("/price-list-pull")
+async def get_price_list_pull_metrics():
+    return price_list_puller.stats()
+
+
+@router_metrics.get("/price-list-parser")
+async def get_price_list_parser_metrics():
+    return price_list_parser.stats()
+
+
+@router_metrics.get("/queries")
+async def get_query_metrics():
+    return route_stats
@@ -0,0 +1,199 @@
+"""
+Outbound notification queue.
+
+Request handlers only put a ``Notification`` on a bounded asyncio queue and
+return. A fixed pool of workers takes notifications off the queue in batches
+and hands every batch to a sender. The sender reports which notifications
+of the batch failed, and only those are retried, with exponential backoff,
+so delivered ones are never sent twice. When the queue is full, ``enqueue`` waits a short while
+and then drops the notification, so a slow mail server cannot stall requests.
+"""
+import asyncio
+import logging
+import smtplib
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+from src.config import (SMTP_HOST, SMTP_PORT, SMTP_FROM, NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE,
+                        NOTIFY_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Notification:
+    kind: str
+    recipient: str
+    subject: str
+    body: str
+    attempts: int = 0
+
+
+class LogSender:
+    """
+    Sender used when no SMTP server is configured.
+
+    Bodies may carry reset and verification tokens, so they are only logged at DEBUG.
+    """
+
+    async def send_batch(self, notifications: List[Notification]) -> List[Notification]:
+        for notification in notifications:
+            logger.info("%s -> %s: %s", notification.kind, notification.recipient, notification.subject)
+            logger.debug("%s -> %s body: %s", notification.kind, notification.recipient, notification.body)
+        return []
+
+
+class SMTPSender:
+    """Deliver every batch over one SMTP connection, in a worker thread."""
+
+    def __init__(self, host: str, port: int = 25, sender: str = SMTP_FROM, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    async def send_batch(self, notifications: List[Notification]) -> List[Notification]:
+        """
+        Send the notifications.
+
+        :return: Notifications that were not delivered.
+        :raises OSError: No connection to the server, nothing was delivered.
+        """
+        return await asyncio.to_thread(self._send, notifications)
+
+    def _send(self, notifications: List[Notification]) -> List[Notification]:
+        failed = []
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for number, notification in enumerate(notifications):
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = notification.recipient
+                message["Subject"] = notification.subject
+                message.set_content(notification.body)
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # The rest of the batch was never attempted
+                    failed.extend(notifications[number:])
+                    break
+                except (smtplib.SMTPException, OSError) as error:
+                    logger.warning("Failed to send %s to %s: %s", notification.kind, notification.recipient, error)
+                    failed.append(notification)
+        return failed
+
+
+class NotificationQueue:
+
+    def __init__(self,
+                 sender,
+                 workers: int = NOTIFY_WORKERS,
+                 maxsize: int = NOTIFY_QUEUE_SIZE,
+                 batch_size: int = NOTIFY_BATCH_SIZE,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+                 backoff: float = 0.5,
+                 enqueue_timeout: float = 0.05):
+        self.sender = sender
+        self.workers = workers
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries = set()
+        self.enqueued = 0
+        self.sent = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5):
+        """Give the workers ``timeout`` seconds to drain the queue, then cancel them."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%d notifications left undelivered", self._queue.qsize())
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def enqueue(self, notification: Notification) -> bool:
+        """
+        Put a notification on the queue.
+
+        :return: False if the queue stayed full for ``enqueue_timeout``
+        seconds, or the workers are not running, and it was dropped.
+        """
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            await asyncio.wait_for(self._queue.put(notification), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _work(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                try:
+                    failed = await self.sender.send_batch(batch)
+                    self.batches += 1
+                except Exception:
+                    logger.exception("Failed to send %d notifications", len(batch))
+                    failed = batch
+                self.sent += len(batch) - len(failed)
+                for notification in failed:
+                    self._retry(notification)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _retry(self, notification: Notification):
+        notification.attempts += 1
+        if notification.attempts >= self.max_attempts:
+            self.failed += 1
+            return
+        self.retried += 1
+        task = asyncio.create_task(self._requeue(notification, self.backoff * 2 ** (notification.attempts - 1)))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, notification: Notification, delay: float):
+        await asyncio.sleep(delay)
+        if self._queue is None or self._queue.full():
+            self.dropped += 1
+            return
+        self._queue.put_nowait(notification)
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers,
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "maxsize": self.maxsize,
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "batches": self.batches,
+                "retried": self.retried,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                }
+
+
+notification_queue = NotificationQueue(SMTPSender(SMTP_HOST, SMTP_PORT) if SMTP_HOST else LogSender())
@@ -0,0 +1,274 @@
+"""
+Parallel import of many price lists, one YAML file per shop.
+
+Parsing and validation are CPU-bound, so files are parsed in a process
+pool. A worker streams the validated batches of a file into a temporary
+spool file, and the parent only gets the path back. Spooled price lists are
+handed over through a bounded queue to a few async writers, each importing
+one shop per transaction and reading one batch at a time from the spool.
+Memory therefore holds a batch per parser and per writer, no matter how
+large or how many the files are; at most ``queue_size`` spools wait on disk.
+
+The web process parses uploaded and pulled price lists the same way, on the
+small ``price_list_parser`` pool, so that parsing never blocks its event loop.
+
+Shops share categories, products and parameters, so concurrent writers can
+deadlock on them now and then; such a shop is rolled back and written again.
+
+Usage::
+
+    python -m src.ordering_goods.bulk_import data/ --jobs 8 --writers 4
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (IMPORT_BATCH_SIZE, IMPORT_MAX_ATTEMPTS, IMPORT_PARSE_WORKERS, IMPORT_QUEUE_SIZE,
+                        IMPORT_SERVER_PARSE_WORKERS, IMPORT_WRITERS)
+from src.ordering_goods.importer import PriceListHeader, read_price_list, write_price_list
+from src.ordering_goods.schemas import PriceListGood, PriceListImportResult
+
+DEADLOCK_DETECTED = "40P01"
+
+
+@dataclass
+class ParsedPriceList:
+    path: str
+    spool_path: str
+    goods: int
+    seconds: float
+
+    def batches(self) -> Iterator[Tuple[PriceListHeader, List[PriceListGood]]]:
+        """Read the parsed batches back from the spool, one at a time."""
+        with open(self.spool_path, "rb") as spool:
+            header = pickle.load(spool)
+            while True:
+                try:
+                    batch = pickle.load(spool)
+                except EOFError:
+                    return
+                yield header, batch
+
+    def discard(self):
+        """Delete the spool file."""
+        try:
+            os.unlink(self.spool_path)
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class BulkImportResult:
+    results: Dict[str, PriceListImportResult]
+    failures: Dict[str, str]
+    seconds: float
+
+    @property
+    def goods(self) -> int:
+        return sum(result.goods for result in self.results.values())
+
+
+def parse_price_list_file(path: str, batch_size: int) -> ParsedPriceList:
+    """
+    Parse a price list file into a spool of pickled batches, runs in a worker process.
+
+    The spool holds the header followed by the batches of goods. It belongs
+    to the caller, who must ``discard`` it once written.
+    """
+    started = time.perf_counter()
+    goods = 0
+    fd, spool_path = tempfile.mkstemp(prefix="price-list-", suffix=".pickle")
+    try:
+        with open(path, "rb") as stream, os.fdopen(fd, "wb") as spool:
+            for number, (header, batch) in enumerate(read_price_list(stream, batch_size)):
+                if number == 0:
+                    pickle.dump(header, spool, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+                goods += len(batch)
+    except BaseException:
+        os.unlink(spool_path)
+        raise
+    return ParsedPriceList(path, spool_path, goods, time.perf_counter() - started)
+
+
+class PriceListParser:
+    """Process pool parsing price lists for the web process, started on first use."""
+
+    def __init__(self, workers: int = IMPORT_SERVER_PARSE_WORKERS):
+        self.workers = workers
+        self.parsed = 0
+        self.failed = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def parse(self, path: str, batch_size: int = IMPORT_BATCH_SIZE) -> ParsedPriceList:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            parsed = await loop.run_in_executor(self._pool, parse_price_list_file, path, batch_size)
+        except Exception:
+            self.failed += 1
+            raise
+        self.parsed += 1
+        return parsed
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers,
+                "parsed": self.parsed,
+                "failed": self.failed,
+                }
+
+
+price_list_parser = PriceListParser()
+
+
+async def import_price_list_file(session: AsyncSession,
+                                 path: str,
+                                 batch_size: int = IMPORT_BATCH_SIZE,
+                                 shop: Optional[str] = None,
+                                 owner_id: Optional[int] = None,
+                                 ) -> PriceListImportResult:
+    """
+    Import a price list file parsed on ``price_list_parser``, in a single transaction.
+
+    Same as ``import_price_list``, but only the writes run on the event loop.
+
+    :param path: Price list file, left in place.
+    :raises ValueError: The document is malformed or belongs to another shop.
+    :raises ShopNotOwned: The shop belongs to another user.
+    """
+    parsed = await price_list_parser.parse(path, batch_size)
+    try:
+        return await write_price_list(session, parsed.batches(), shop, owner_id)
+    finally:
+        parsed.discard()
+
+
+def find_price_lists(paths: List[str]) -> List[str]:
+    """Expand directories into the YAML files they contain."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith((".yaml", ".yml"))))
+        else:
+            found.append(path)
+    return found
+
+
+def _is_deadlock(error: DBAPIError) -> bool:
+    return getattr(error.orig, "sqlstate", None) == DEADLOCK_DETECTED
+
+
+async def import_price_lists(paths: List[str],
+                             jobs: int = IMPORT_PARSE_WORKERS,
+                             writers: int = IMPORT_WRITERS,
+                             queue_size: int = IMPORT_QUEUE_SIZE,
+                             batch_size: int = IMPORT_BATCH_SIZE,
+                             max_attempts: int = IMPORT_MAX_ATTEMPTS,
+                             ) -> BulkImportResult:
+    """
+    Import price list files in parallel.
+
+    A file that fails to parse or to write is reported in ``failures`` and
+    does not stop the others.
+
+    :param paths: Price list files.
+    :param jobs: Parser processes.
+    :param writers: Concurrent database writers, each holding one connection.
+    :param queue_size: Spooled files allowed to wait for a writer.
+    :param batch_size: Goods per upsert batch.
+    :param max_attempts: Attempts per shop when writers deadlock.
+    """
+    from src.database import async_session_maker
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Optional[ParsedPriceList]] = asyncio.Queue(maxsize=queue_size)
+    results: Dict[str, PriceListImportResult] = {}
+    failures: Dict[str, str] = {}
+
+    async def parse(pool: ProcessPoolExecutor):
+        pending = {}
+        remaining = iter(paths)
+        while True:
+            # Keep every process busy, but only submit more once the queue has room
+            while len(pending) < jobs and (path := next(remaining, None)) is not None:
+                pending[loop.run_in_executor(pool, parse_price_list_file, path, batch_size)] = path
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    parsed = future.result()
+                except Exception as error:
+                    failures[path] = f"{type(error).__name__}: {error}"
+                    continue
+                await queue.put(parsed)
+        for _ in range(writers):
+            await queue.put(None)
+
+    async def write():
+        while (parsed := await queue.get()) is not None:
+            try:
+                for attempt in range(1, max_attempts + 1):
+                    async with async_session_maker() as session:
+                        try:
+                            results[parsed.path] = await write_price_list(session, parsed.batches())
+                            break
+                        except Exception as error:
+                            await session.rollback()
+                            if isinstance(error, DBAPIError) and _is_deadlock(error) and attempt < max_attempts:
+                                continue
+                            failures[parsed.path] = f"{type(error).__name__}: {error}"
+                            break
+            finally:
+                parsed.discard()
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        await asyncio.gather(parse(pool), *(write() for _ in range(writers)))
+    return BulkImportResult(results, failures, time.perf_counter() - started)
+
+
+async def main(args: argparse.Namespace):
+    from src.database import engine
+
+    paths = find_price_lists(args.paths)
+    bulk = await import_price_lists(paths, args.jobs, args.writers, args.queue_size, args.batch_size)
+    await engine.dispose()
+    for path, result in bulk.results.items():
+        print(f"{path}: shop {result.shop}, {result.goods} goods ({result.new} new, {result.changed} changed, "
+              f"{result.removed} removed) in {result.seconds:.2f}s")
+    for path, error in bulk.failures.items():
+        print(f"{path}: failed, {error}")
+    print(f"{len(bulk.results)}/{len(paths)} price lists, {bulk.goods} goods in {bulk.seconds:.2f}s "
+          f"({bulk.goods / bulk.seconds if bulk.seconds else 0:.0f} goods/s)")
+    if bulk.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import many supplier price lists in parallel")
+    parser.add_argument("paths", nargs="+", help="YAML price list files or directories with them")
+    parser.add_argument("--jobs", type=int, default=IMPORT_PARSE_WORKERS, help="parser processes")
+    parser.add_argument("--writers", type=int, default=IMPORT_WRITERS, help="concurrent database writers")
+    parser.add_argument("--queue-size", type=int, default=IMPORT_QUEUE_SIZE,
+                        help="spooled price lists waiting for a writer")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Streaming exports of a shop owner's offers and orders.
+
+Rows are read from a server-side cursor a chunk at a time, encoded as CSV or
+NDJSON and optionally gzip-compressed on the fly, so an export of millions
+of rows runs in constant memory and its first bytes go out right away.
+The queries leave row order to the plan: a sort would have to read every
+row before the first one is sent.
+"""
+import csv
+import io
+import zlib
+from typing import Any, AsyncIterator, List, Sequence
+
+import orjson
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import Order, OrderItem, OrderStateEnum, ProductInfo, Shop
+
+CSV = "csv"
+NDJSON = "ndjson"
+MEDIA_TYPES = {CSV: "text/csv; charset=utf-8", NDJSON: "application/x-ndjson"}
+
+
+def offers_query(user_id: int) -> Select:
+    """Offers of all shops owned by the user."""
+    return (select(ProductInfo.id, ProductInfo.shop_id, ProductInfo.external_id, ProductInfo.product_id,
+                   ProductInfo.model, ProductInfo.quantity, ProductInfo.price, ProductInfo.price_rrc)
+            .join(Shop, ProductInfo.shop_id == Shop.id)
+            .where(Shop.user_id == user_id))
+
+
+def orders_query(user_id: int) -> Select:
+    """Order items of the user's shops, one row per item, baskets excluded."""
+    return (select(Order.id.label("order_id"), Order.dt_at, Order.state, ProductInfo.shop_id,
+                   OrderItem.product_info_id, ProductInfo.external_id, ProductInfo.model, OrderItem.quantity,
+                   ProductInfo.price)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .join(ProductInfo, OrderItem.product_info_id == ProductInfo.id)
+            .join(Shop, ProductInfo.shop_id == Shop.id)
+            .where(Shop.user_id == user_id, Order.state != OrderStateEnum.BASKET.value))
+
+
+def _encode_csv(columns: Sequence[str], rows: List[Any], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _encode_ndjson(columns: Sequence[str], rows: List[Any]) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+async def stream_rows(session: AsyncSession,
+                      query: Select,
+                      format: str = CSV,
+                      chunk_size: int = 5000,
+                      ) -> AsyncIterator[bytes]:
+    """
+    Encode query rows chunk by chunk.
+
+    :param format: ``csv`` (with a header row) or ``ndjson``.
+    :param chunk_size: Rows fetched from the cursor and encoded at a time.
+    """
+    result = await session.stream(query.execution_options(yield_per=chunk_size))
+    columns = list(result.keys())
+    if format == CSV:
+        # The header goes out even when there are no rows
+        yield _encode_csv(columns, [], header=True)
+    async for partition in result.partitions():
+        if format == CSV:
+            yield _encode_csv(columns, partition, header=False)
+        else:
+            yield _encode_ndjson(columns, partition)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a byte stream into gzip format as it goes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,168 @@
+"""
+Precomputed facet counts for parameter-based filtering.
+
+``category_facet`` holds, per category, the number of in-stock offers for
+every parameter value. Checkouts and incremental imports apply +1/-1 deltas
+for the offers they change and delete the rows they bring down to zero.
+``refresh_category_facets`` recounts whole categories to repair counts after
+data was changed behind the application's back:
+
+    python -m src.ordering_goods.facets [category_id ...]
+"""
+import argparse
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, delete, exists, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from src.database import chunked
+from src.db.models import Category, CategoryFacet, Parameter, Product, ProductInfo, ProductParameter
+
+FACET_COLUMNS = ["category_id", "parameter_id", "value", "count"]
+# First key of the transaction-level advisory locks taken per category by recounts
+FACET_LOCK = 0x0FAC
+
+
+def _counts_query(count) -> Select:
+    return (select(Product.category_id, ProductParameter.parameter_id, ProductParameter.value, count)
+            .join(ProductInfo, ProductParameter.product_info_id == ProductInfo.id)
+            .join(Product, ProductInfo.product_id == Product.id)
+            .where(ProductParameter.parameter_id.is_not(None),
+                   ProductParameter.value.is_not(None),
+                   Product.category_id.is_not(None))
+            .group_by(Product.category_id, ProductParameter.parameter_id, ProductParameter.value)
+            )
+
+
+async def refresh_category_facets(session: AsyncSession, category_ids: Iterable[int]):
+    """
+    Recount the facets of the given categories inside the current transaction.
+
+    Recounts of a category are serialized with an advisory lock, and counts
+    are upserted, since deltas of other transactions may have created rows
+    for the category in the meantime.
+    """
+    category_ids = sorted(set(category_ids))
+    if not category_ids:
+        return
+    for category_id in category_ids:
+        await session.execute(select(func.pg_advisory_xact_lock(FACET_LOCK, category_id)))
+    await session.execute(delete(CategoryFacet).where(CategoryFacet.category_id.in_(category_ids)))
+    counts = _counts_query(func.count()).where(Product.category_id.in_(category_ids),
+                                               ProductInfo.quantity > 0)
+    stmt = insert(CategoryFacet).from_select(FACET_COLUMNS, counts)
+    stmt = stmt.on_conflict_do_update(index_elements=[CategoryFacet.category_id,
+                                                      CategoryFacet.parameter_id,
+                                                      CategoryFacet.value],
+                                      set_={"count": stmt.excluded.count})
+    await session.execute(stmt)
+
+
+async def adjust_facets(session: AsyncSession,
+                        removed: Iterable[int] = (),
+                        added: Iterable[int] = ()):
+    """
+    Apply the facet contribution of single offers as deltas.
+
+    Used when offers sell out or come back in stock, and by incremental
+    imports around changing an offer. Rows brought down to zero are deleted.
+
+    :param removed: ``ProductInfo`` ids whose parameters no longer count.
+    :param added: ``ProductInfo`` ids whose parameters count from now on.
+    """
+    for product_info_ids, sign in ((sorted(set(removed)), -1), (sorted(set(added)), 1)):
+        if not product_info_ids:
+            continue
+        # Sorted, so that concurrent checkouts lock facet rows in the same order
+        deltas = (_counts_query(func.count() * sign)
+                  .where(ProductInfo.id.in_(product_info_ids))
+                  .order_by(Product.category_id, ProductParameter.parameter_id, ProductParameter.value))
+        stmt = insert(CategoryFacet).from_select(FACET_COLUMNS, deltas)
+        stmt = stmt.on_conflict_do_update(index_elements=[CategoryFacet.category_id,
+                                                          CategoryFacet.parameter_id,
+                                                          CategoryFacet.value],
+                                          set_={"count": CategoryFacet.count + stmt.excluded.count},
+                                          ).returning(CategoryFacet.category_id, CategoryFacet.parameter_id,
+                                                      CategoryFacet.value, CategoryFacet.count)
+        result = await session.execute(stmt)
+        if sign > 0:
+            continue
+        emptied = [{"category_id": row.category_id, "parameter_id": row.parameter_id, "value": row.value}
+                   for row in result if row.count <= 0]
+        # The upsert holds the row locks, so no other transaction revived these rows
+        for chunk in chunked(emptied):
+            await session.execute(delete(CategoryFacet)
+                                  .where(tuple_(CategoryFacet.category_id,
+                                                CategoryFacet.parameter_id,
+                                                CategoryFacet.value).in_([tuple(row.values()) for row in chunk]))
+                                  .execution_options(synchronize_session=False))
+
+
+def category_facets_query(category_id: int, filters: Optional[List[Tuple[int, str]]] = None) -> Select:
+    """
+    Build the query for parameter value counts of a category.
+
+    Without filters the counts come straight from ``category_facet``. With
+    ``(parameter_id, value)`` filters they are recounted over the in-stock
+    offers matching all of them.
+    """
+    if not filters:
+        query = (select(CategoryFacet.parameter_id, Parameter.name, CategoryFacet.value, CategoryFacet.count)
+                 .join(Parameter, CategoryFacet.parameter_id == Parameter.id)
+                 .where(CategoryFacet.category_id == category_id, CategoryFacet.count > 0)
+                 .order_by(Parameter.name, CategoryFacet.value)
+                 )
+    else:
+        query = (select(ProductParameter.parameter_id, Parameter.name, ProductParameter.value, func.count())
+                 .join(ProductInfo, ProductParameter.product_info_id == ProductInfo.id)
+                 .join(Product, ProductInfo.product_id == Product.id)
+                 .join(Parameter, ProductParameter.parameter_id == Parameter.id)
+                 .where(Product.category_id == category_id,
+                        ProductInfo.quantity > 0,
+                        ProductParameter.value.is_not(None))
+                 .group_by(ProductParameter.parameter_id, Parameter.name, ProductParameter.value)
+                 .order_by(Parameter.name, ProductParameter.value)
+                 )
+        for parameter_id, value in filters:
+            matching = aliased(ProductParameter)
+            query = query.where(exists().where(matching.product_info_id == ProductInfo.id,
+                                               matching.parameter_id == parameter_id,
+                                               matching.value == value))
+    return query
+
+
+async def get_category_facets(session: AsyncSession,
+                              category_id: int,
+                              filters: Optional[List[Tuple[int, str]]] = None,
+                              ) -> List[Dict[str, Any]]:
+    """Return parameter value counts of a category grouped by parameter, see ``category_facets_query``."""
+    result = await session.execute(category_facets_query(category_id, filters))
+    facets: Dict[int, Dict[str, Any]] = {}
+    for parameter_id, name, value, value_count in result:
+        facet = facets.setdefault(parameter_id, {"parameter_id": parameter_id, "name": name, "values": []})
+        facet["values"].append({"value": value, "count": value_count})
+    return list(facets.values())
+
+
+async def main(category_ids: List[int]):
+    from src.database import async_session_maker, engine
+
+    async with async_session_maker() as session:
+        if not category_ids:
+            category_ids = list(await session.scalars(select(Category.id).order_by(Category.id)))
+    # One transaction per category, so that checkouts wait on one lock at a time
+    for category_id in category_ids:
+        async with async_session_maker() as session:
+            await refresh_category_facets(session, [category_id])
+            await session.commit()
+    await engine.dispose()
+    print(f"Recounted facets of {len(category_ids)} categories")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recount precomputed facet counts")
+    parser.add_argument("category_ids", nargs="*", type=int, help="categories to recount, all by default")
+    asyncio.run(main(parser.parse_args().category_ids))
@@ -0,0 +1,493 @@
+"""
+Streaming importer for supplier price lists in the ``data/shop1.yaml`` format.
+
+The YAML document is read event by event, so only one batch of goods is kept
+in memory at a time. Every batch is written with a handful of multi-row
+``INSERT ... ON CONFLICT`` statements instead of one statement per row.
+
+Re-imports are incremental: every offer stores a hash of its price list
+entry, so unchanged goods are skipped and only new, changed and vanished
+offers are written.
+
+Usage::
+
+    python -m src.ordering_goods.importer data/shop1.yaml
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import yaml
+from sqlalchemy import BigInteger, Integer, String, and_, column, delete, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from yaml.events import (DocumentStartEvent, MappingEndEvent, MappingStartEvent,
+                         SequenceEndEvent, SequenceStartEvent)
+
+from src.config import IMPORT_BATCH_SIZE
+from src.database import MAX_BIND_PARAMS, chunked
+from src.db.models import (Category, Product, ProductInfo, ProductParameter,
+                           Shop, ShopCategory)
+from src.ordering_goods.facets import adjust_facets
+from src.ordering_goods.names import category_names, parameter_names
+from src.ordering_goods.offer_index import offer_index
+from src.ordering_goods.schemas import CategoryCreate, PriceListGood, PriceListImportResult
+from src.ordering_goods.utils import invalidate_categories_on_commit
+from src.ordering_goods.versions import CATEGORIES, SHOPS, bump_catalog_version
+
+OFFER_UPDATE_COLUMNS = [column("id", Integer),
+                        column("model", String),
+                        column("product_id", Integer),
+                        column("quantity", Integer),
+                        column("price", Integer),
+                        column("price_rrc", Integer),
+                        column("content_hash", BigInteger),
+                        ]
+
+
+class ShopNotOwned(ValueError):
+    pass
+
+
+def iter_price_list(stream: IO) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield ``(section, item)`` pairs of a price list without loading it whole.
+
+    Sequence sections (``categories``, ``goods``) are yielded item by item,
+    scalar sections (``shop``, ``url``) are yielded once.
+
+    :param stream: Text or binary file-like object with the YAML document.
+    :raises ValueError: The document is not a mapping.
+    """
+    loader = yaml.SafeLoader(stream)
+    try:
+        loader.get_event()  # StreamStartEvent
+        if not loader.check_event(DocumentStartEvent):
+            raise ValueError("Price list is empty")
+        loader.get_event()
+        if not loader.check_event(MappingStartEvent):
+            raise ValueError("Price list must be a mapping")
+        loader.get_event()
+        while not loader.check_event(MappingEndEvent):
+            section = _construct_next(loader)
+            if loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(SequenceEndEvent):
+                    yield section, _construct_next(loader)
+                loader.get_event()
+            else:
+                yield section, _construct_next(loader)
+    finally:
+        loader.dispose()
+
+
+def _construct_next(loader: yaml.SafeLoader) -> Any:
+    node = loader.compose_node(None, None)
+    loader.anchors = {}
+    return loader.construct_document(node)
+
+
+def content_hash(good: PriceListGood) -> int:
+    """Signed 64-bit hash of everything a price list says about one good."""
+    data = repr((good.category, good.model, good.name, good.price, good.price_rrc, good.quantity,
+                 sorted(good.parameters.items())))
+    return int.from_bytes(blake2b(data.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class PriceListWriter:
+    """
+    Write one shop's price list with set-based upserts.
+
+    The shop's offers are loaded up front as external id -> (id, content hash,
+    in stock). Goods whose hash did not change are skipped, changed goods are
+    updated by id with their parameters replaced, new goods are inserted, and
+    offers missing from the list are marked out of stock by ``finish``. A
+    re-import therefore only writes what changed. Facet counts follow with
+    deltas for the offers touched. An external id repeated within the list
+    is written once, the first occurrence wins. The shop and category
+    listing versions are only bumped when the shop row, its category links
+    or the categories changed, so unchanged re-imports keep clients' ETags.
+
+    Parameter and category names are resolved through the process-wide
+    interners, so known names cost no query at all.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.shop_id: Optional[int] = None
+        self.parameter_ids: Dict[str, int] = {}
+        self.known: Dict[int, Tuple[int, Optional[int], bool]] = {}
+        # External ids written so far, across batches
+        self.seen: Set[int] = set()
+        self.goods = 0
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.duplicates = 0
+        self.rows = 0
+        self.shop_state: Optional[bool] = None
+        # Catalog resources whose listings the import changed, their versions are bumped by ``finish``
+        self.changed_resources: Set[str] = set()
+        # Committed into the offer index after the import
+        self.index_rows: List[Tuple[int, int, int, int, int, int]] = []
+
+    async def write_shop(self, name: str, url: Optional[str] = None, owner_id: Optional[int] = None) -> int:
+        """
+        Create or update the shop.
+
+        :param owner_id: If given, the shop must belong to this user or to nobody,
+        in which case the user becomes its owner.
+        :raises ShopNotOwned: The shop belongs to another user.
+        """
+        values = {"name": name}
+        if url is not None:
+            values["url"] = url
+        if owner_id is not None:
+            values["user_id"] = owner_id
+        stmt = insert(Shop).values(**values)
+        # Only rewrite the row when something differs, so that re-imports leave the shop listing's version alone
+        changed = or_(*(getattr(Shop, key).is_distinct_from(stmt.excluded[key]) for key in values))
+        stmt = stmt.on_conflict_do_update(index_elements=[Shop.name],
+                                          set_={key: stmt.excluded[key] for key in values},
+                                          where=changed if owner_id is None else and_(
+                                              changed, or_(Shop.user_id.is_(None), Shop.user_id == owner_id)),
+                                          ).returning(Shop.id, Shop.state)
+        result = await self.session.execute(stmt)
+        row = result.one_or_none()
+        if row is None:
+            # Either unchanged or another user's
+            result = await self.session.execute(select(Shop.id, Shop.state, Shop.user_id).where(Shop.name == name))
+            shop_id, state, user_id = result.one()
+            if owner_id is not None and user_id != owner_id:
+                raise ShopNotOwned(f"Shop {name!r} belongs to another user")
+            row = (shop_id, state)
+        else:
+            self.changed_resources.add(SHOPS)
+            self.rows += 1
+        self.shop_id, self.shop_state = row
+        await self._load_known()
+        return self.shop_id
+
+    async def _load_known(self):
+        query = (select(ProductInfo.external_id, ProductInfo.id, ProductInfo.content_hash, ProductInfo.quantity)
+                 .where(ProductInfo.shop_id == self.shop_id)
+                 .execution_options(yield_per=10000))
+        result = await self.session.stream(query)
+        async for external_id, product_info_id, known_hash, quantity in result:
+            self.known[external_id] = (product_info_id, known_hash, bool(quantity))
+
+    async def write_categories(self, categories: List[Dict[str, Any]]):
+        await category_names.warm(self.session)
+        categories = sorted(categories, key=lambda category: category["id"])
+        # Re-sent price lists usually only name categories that exist already
+        unknown = [category for category in categories if category_names.ids.get(category["name"]) != category["id"]]
+        if unknown:
+            invalidate_categories_on_commit(self.session)
+        for chunk in chunked(unknown):
+            result = await self.session.execute(insert(Category).values(chunk).on_conflict_do_nothing()
+                                                .returning(Category.id, Category.name))
+            created = {row.name: row.id for row in result}
+            category_names.remember_on_commit(self.session, created)
+            if created:
+                self.changed_resources.add(CATEGORIES)
+            self.rows += len(created)
+        links = [{"shop_id": self.shop_id, "category_id": category["id"]} for category in categories]
+        for chunk in chunked(links):
+            result = await self.session.execute(insert(ShopCategory).values(chunk).on_conflict_do_nothing()
+                                                .returning(ShopCategory.category_id))
+            linked = len(result.all())
+            if linked:
+                # Shops are listed with their categories
+                self.changed_resources.add(SHOPS)
+            self.rows += linked
+
+    async def write_goods(self, goods: List[PriceListGood]):
+        new: Dict[int, Tuple[PriceListGood, int]] = {}
+        changed: Dict[int, Tuple[PriceListGood, int]] = {}
+        was_in_stock = []
+        for good in goods:
+            if good.id in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(good.id)
+            good_hash = content_hash(good)
+            known = self.known.pop(good.id, None)
+            if known is None:
+                new[good.id] = (good, good_hash)
+            elif known[1] == good_hash:
+                self.unchanged += 1
+            else:
+                changed[known[0]] = (good, good_hash)
+                if known[2]:
+                    was_in_stock.append(known[0])
+        self.goods += len(goods)
+        if not new and not changed:
+            return
+
+        touched = [good for good, _ in (*new.values(), *changed.values())]
+        product_ids = await self._upsert_products(touched)
+        await self._resolve_parameters(touched)
+        await adjust_facets(self.session, removed=was_in_stock)
+
+        offer_ids = await self._insert_offers(new.values(), product_ids)
+        await self._update_offers(changed, product_ids)
+        offer_ids.update({product_info_id: good for product_info_id, (good, _) in changed.items()})
+        await self._replace_parameters(offer_ids, changed.keys())
+        if offer_index.loaded:
+            self.index_rows.extend((product_info_id, product_ids[(good.name, good.category)], self.shop_id,
+                                    good.price, good.price_rrc, good.quantity)
+                                   for product_info_id, good in offer_ids.items())
+        await adjust_facets(self.session, added=[product_info_id for product_info_id, good in offer_ids.items()
+                                                 if good.quantity > 0])
+        self.new += len(new)
+        self.changed += len(changed)
+
+    async def finish(self):
+        """Mark offers that were not in the price list as out of stock, call last before commit."""
+        removed = [product_info_id for product_info_id, _, _ in self.known.values()]
+        sold_out = []
+        for start in range(0, len(removed), MAX_BIND_PARAMS):
+            result = await self.session.execute(update(ProductInfo)
+                                                .where(ProductInfo.id.in_(removed[start:start + MAX_BIND_PARAMS]),
+                                                       ProductInfo.quantity > 0)
+                                                .values(quantity=0, content_hash=None)
+                                                .returning(ProductInfo.id)
+                                                .execution_options(synchronize_session=False))
+            sold_out.extend(result.scalars())
+        await adjust_facets(self.session, removed=sold_out)
+        self.removed = len(removed)
+        self.rows += len(sold_out)
+        self.known = {}
+        offer_index.apply_on_commit(self.session, rows=self.index_rows,
+                                    quantities=dict.fromkeys(sold_out, 0),
+                                    shops={self.shop_id: self.shop_state})
+        self.index_rows = []
+        if self.changed_resources:
+            await bump_catalog_version(self.session, *self.changed_resources)
+
+    def _offer_row(self, good: PriceListGood, good_hash: int, product_ids: Dict[Tuple[str, int], int]):
+        return {"model": good.model,
+                "external_id": good.id,
+                "product_id": product_ids[(good.name, good.category)],
+                "shop_id": self.shop_id,
+                "quantity": good.quantity,
+                "price": good.price,
+                "price_rrc": good.price_rrc,
+                "content_hash": good_hash,
+                }
+
+    async def _insert_offers(self, goods, product_ids) -> Dict[int, PriceListGood]:
+        rows = {}
+        by_key = {}
+        for good, good_hash in goods:
+            row = self._offer_row(good, good_hash, product_ids)
+            rows[(row["product_id"], good.id)] = row
+            by_key[(row["product_id"], good.id)] = good
+        offer_ids = {}
+        for chunk in chunked(list(rows.values())):
+            stmt = insert(ProductInfo).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                constraint="_unique_product_info",
+                set_={"model": stmt.excluded.model,
+                      "quantity": stmt.excluded.quantity,
+                      "price": stmt.excluded.price,
+                      "price_rrc": stmt.excluded.price_rrc,
+                      "content_hash": stmt.excluded.content_hash,
+                      },
+            ).returning(ProductInfo.id, ProductInfo.product_id, ProductInfo.external_id)
+            result = await self.session.execute(stmt)
+            offer_ids.update({row.id: by_key[(row.product_id, row.external_id)] for row in result})
+        self.rows += len(rows)
+        return offer_ids
+
+    async def _update_offers(self, changed: Dict[int, Tuple[PriceListGood, int]], product_ids):
+        rows = [{"id": product_info_id, **self._offer_row(good, good_hash, product_ids)}
+                for product_info_id, (good, good_hash) in changed.items()]
+        for chunk in chunked(rows, MAX_BIND_PARAMS // len(OFFER_UPDATE_COLUMNS)):
+            data = values(*OFFER_UPDATE_COLUMNS, name="changed").data(
+                [tuple(row[name.name] for name in OFFER_UPDATE_COLUMNS) for row in chunk])
+            await self.session.execute(update(ProductInfo)
+                                       .where(ProductInfo.id == data.c.id)
+                                       .values({name.name: data.c[name.name] for name in OFFER_UPDATE_COLUMNS[1:]})
+                                       .execution_options(synchronize_session=False))
+        self.rows += len(rows)
+
+    async def _replace_parameters(self, offers: Dict[int, PriceListGood], changed_ids: Iterable[int]):
+        changed_ids = list(changed_ids)
+        for start in range(0, len(changed_ids), MAX_BIND_PARAMS):
+            await self.session.execute(delete(ProductParameter)
+                                       .where(ProductParameter.product_info_id.in_(
+                                           changed_ids[start:start + MAX_BIND_PARAMS])))
+        rows = [{"product_info_id": product_info_id,
+                 "parameter_id": self.parameter_ids[name],
+                 "value": value,
+                 }
+                for product_info_id, good in offers.items()
+                for name, value in good.parameters.items()]
+        for chunk in chunked(rows):
+            stmt = insert(ProductParameter).values(chunk)
+            stmt = stmt.on_conflict_do_update(constraint="_unique_product_info_parameter",
+                                              set_={"value": stmt.excluded.value},
+                                              )
+            await self.session.execute(stmt)
+        self.rows += len(rows)
+
+    async def _upsert_products(self, goods: List[PriceListGood]) -> Dict[Tuple[str, int], int]:
+        products = {(good.name, good.category): {"name": good.name, "category_id": good.category}
+                    for good in goods}
+        product_ids = {}
+        # Sorted, so that concurrent imports lock shared products in the same order
+        for chunk in chunked([products[key] for key in sorted(products)]):
+            stmt = insert(Product).values(chunk)
+            # DO UPDATE instead of DO NOTHING so that existing rows are returned too
+            stmt = stmt.on_conflict_do_update(constraint="_unique_product",
+                                              set_={"name": stmt.excluded.name},
+                                              ).returning(Product.id, Product.name, Product.category_id)
+            result = await self.session.execute(stmt)
+            product_ids.update({(row.name, row.category_id): row.id for row in result})
+        self.rows += len(products)
+        return product_ids
+
+    async def _resolve_parameters(self, goods: List[PriceListGood]):
+        names = {name for good in goods for name in good.parameters} - self.parameter_ids.keys()
+        if not names:
+            return
+        ids, created = await parameter_names.resolve(self.session, names)
+        self.parameter_ids.update(ids)
+        self.rows += created
+
+
+@dataclass
+class PriceListHeader:
+    shop: str
+    url: Optional[str] = None
+    categories: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def read_price_list(stream: IO, batch_size: int = IMPORT_BATCH_SIZE,
+                    ) -> Iterator[Tuple[PriceListHeader, List[PriceListGood]]]:
+    """
+    Parse and validate a price list into batches of goods.
+
+    Every batch comes with the header of the price list, which is complete
+    by the time goods start. At least one (possibly empty) batch is yielded.
+
+    :param stream: File-like object with the YAML document.
+    :param batch_size: Maximum number of goods per batch.
+    :raises ValueError: The document is malformed, or goods come before
+    the ``shop`` and ``categories`` sections.
+    """
+    header = None
+    shop = None
+    url = None
+    categories = []
+    batch = []
+    for section, item in iter_price_list(stream):
+        if section == "shop":
+            shop = str(item)
+        elif section == "url":
+            url = item
+        elif section == "categories":
+            categories.append(CategoryCreate.parse_obj(item).dict())
+        elif section == "goods":
+            if header is None:
+                if shop is None:
+                    raise ValueError("Section 'shop' must precede 'goods'")
+                header = PriceListHeader(shop, url, categories)
+            batch.append(PriceListGood.parse_obj(item))
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+    if shop is None:
+        raise ValueError("Section 'shop' is missing")
+    if batch or header is None:
+        yield header or PriceListHeader(shop, url, categories), batch
+
+
+async def write_price_list(session: AsyncSession,
+                           batches: Iterable[Tuple[PriceListHeader, List[PriceListGood]]],
+                           shop: Optional[str] = None,
+                           owner_id: Optional[int] = None,
+                           ) -> PriceListImportResult:
+    """
+    Write parsed price list batches in a single transaction.
+
+    Batches may be produced lazily, ``seconds`` then includes parsing.
+
+    :param session: Session to write with, committed on success.
+    :param batches: Output of ``read_price_list``.
+    :param shop: If given, the price list must belong to the shop of this name.
+    :param owner_id: If given, the shop must be owned by this user or by nobody yet.
+    :raises ValueError: The price list belongs to another shop.
+    :raises ShopNotOwned: The shop belongs to another user.
+    :return: Row counts and throughput of the import.
+    """
+    started = time.perf_counter()
+    writer = PriceListWriter(session)
+    header = None
+    for header, batch in batches:
+        if writer.shop_id is None:
+            if shop is not None and header.shop != shop:
+                raise ValueError(f"Price list of shop {header.shop!r} where {shop!r} was expected")
+            await writer.write_shop(header.shop, header.url, owner_id)
+            await writer.write_categories(header.categories)
+        if batch:
+            await writer.write_goods(batch)
+    await writer.finish()
+    await session.commit()
+
+    seconds = time.perf_counter() - started
+    return PriceListImportResult(shop=header.shop,
+                                 goods=writer.goods,
+                                 new=writer.new,
+                                 changed=writer.changed,
+                                 unchanged=writer.unchanged,
+                                 removed=writer.removed,
+                                 duplicates=writer.duplicates,
+                                 rows=writer.rows,
+                                 seconds=seconds,
+                                 rows_per_second=writer.rows / seconds if seconds else 0.0,
+                                 )
+
+
+async def import_price_list(session: AsyncSession,
+                            stream: IO,
+                            batch_size: int = IMPORT_BATCH_SIZE,
+                            shop: Optional[str] = None,
+                            ) -> PriceListImportResult:
+    """
+    Import a price list in a single transaction, parsing while writing.
+
+    :param session: Session to write with, committed on success.
+    :param stream: File-like object with the YAML document.
+    :param batch_size: Number of goods written per batch.
+    :param shop: If given, the price list must belong to the shop of this name.
+    :raises ValueError: The document is malformed, goods come before
+    the ``shop`` and ``categories`` sections, or it belongs to another shop.
+    :return: Row counts and throughput of the import.
+    """
+    return await write_price_list(session, read_price_list(stream, batch_size), shop)
+
+
+async def main(paths: List[str], batch_size: int):
+    from src.database import async_session_maker
+
+    for path in paths:
+        async with async_session_maker() as session:
+            with open(path, "rb") as stream:
+                result = await import_price_list(session, stream, batch_size)
+        print(f"{path}: shop {result.shop}, {result.goods} goods ({result.new} new, {result.changed} changed, "
+              f"{result.removed} removed), {result.rows} rows "
+              f"in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import supplier price lists")
+    parser.add_argument("paths", nargs="+", help="YAML price list files")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.paths, args.batch_size))
@@ -0,0 +1,93 @@
+"""
+Process-wide name -> id interning for ``Parameter`` and ``Category``.
+
+Price lists repeat the same few parameter and category names in every
+entry. The interner loads all known names once, answers lookups from memory
+and creates missing names with one multi-row upsert per batch. Ids created
+in a transaction only become visible to other sessions once it commits, so
+a rolled back import cannot leave ids of rows that never existed behind.
+"""
+from typing import Any, Dict, Iterable, Tuple
+
+from sqlalchemy import event, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import chunked
+from src.db.models import Category, Parameter
+
+
+class NameInterner:
+
+    def __init__(self, model):
+        self.model = model
+        self.ids: Dict[str, int] = {}
+        self.warmed = False
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    async def warm(self, session: AsyncSession):
+        """Load every known name, once per process."""
+        if self.warmed:
+            return
+        result = await session.execute(select(self.model.name, self.model.id).where(self.model.name.is_not(None)))
+        self.ids.update(result.tuples())
+        self.warmed = True
+
+    async def resolve(self, session: AsyncSession, names: Iterable[str]) -> Tuple[Dict[str, int], int]:
+        """
+        Return ids for names, creating the missing ones.
+
+        :param session: Session whose transaction creates missing names.
+        :param names: Names to resolve, duplicates are fine.
+        :return: Mapping of every given name to its id, and the number of
+        names inserted. Names another transaction inserted first are
+        resolved from the database and not counted.
+        """
+        await self.warm(session)
+        names = set(names)
+        ids = {name: self.ids[name] for name in names if name in self.ids}
+        missing = sorted(names - ids.keys())
+        self.hits += len(ids)
+        self.misses += len(missing)
+        inserted = 0
+        for chunk in chunked([{"name": name} for name in missing]):
+            stmt = insert(self.model).values(chunk)
+            # DO UPDATE instead of DO NOTHING so that existing rows are returned too
+            stmt = stmt.on_conflict_do_update(index_elements=[self.model.name],
+                                              set_={"name": stmt.excluded.name},
+                                              ).returning(self.model.id, self.model.name,
+                                                          # Rows updated on conflict have xmax set
+                                                          literal_column("(xmax = 0)").label("inserted"))
+            result = await session.execute(stmt)
+            for row in result:
+                ids[row.name] = row.id
+                inserted += row.inserted
+        if missing:
+            self.remember_on_commit(session, {name: ids[name] for name in missing})
+        return ids, inserted
+
+    def remember_on_commit(self, session: AsyncSession, ids: Dict[str, int]):
+        """Intern ids written by the session once its current transaction commits."""
+
+        def remember(_):
+            self.ids.update(ids)
+            self.created += len(ids)
+
+        event.listen(session.sync_session, "after_commit", remember, once=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self.ids),
+                "warmed": self.warmed,
+                "hits": self.hits,
+                "misses": self.misses,
+                "created": self.created,
+                }
+
+
+parameter_names = NameInterner(Parameter)
+category_names = NameInterner(Category)
@@ -0,0 +1,245 @@
+"""
+In-memory offer index for cheapest-offer and price-range lookups.
+
+In-stock offers are held column-wise in ``array`` columns sorted by product
+and offer id, so the rows of a product are found by bisecting the product
+column. A second pair of arrays maps sorted offer ids to their rows for
+updates. That is 64 bytes per offer and no per-offer Python object. A lookup
+scans only the rows of one product, which are a handful (one per shop), so
+it takes microseconds and no query.
+
+Offers that are new since the last load, or moved to another product, go
+to a small tail dict until the next reload merges them into the arrays.
+
+The index is loaded at startup and reloaded every
+``OFFER_INDEX_REFRESH_INTERVAL`` seconds, which also picks up changes made
+by other processes and drops sold-out rows. Imports and checkouts in this
+process apply their changes right after they commit, changes committed by
+other processes show up within the interval.
+"""
+import asyncio
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.config import OFFER_INDEX_REFRESH_INTERVAL
+from src.db.models import ProductInfo, Shop
+
+logger = logging.getLogger(__name__)
+
+# offer id, product id, shop id, price, price_rrc, quantity
+OfferRow = Tuple[int, int, int, int, int, int]
+COLUMNS = ("offer_id", "product_id", "shop_id", "price", "price_rrc", "quantity")
+
+
+def _zeros(size: int) -> array:
+    return array("q", bytes(8 * size))
+
+
+class OfferIndex:
+
+    def __init__(self):
+        self.offer_id = array("q")
+        self.product_id = array("q")
+        self.shop_id = array("q")
+        self.price = array("q")
+        self.price_rrc = array("q")
+        self.quantity = array("q")
+        self.active_shops: Set[int] = set()
+        self.loaded_at: Optional[float] = None
+        self.load_seconds = 0.0
+        self.lookups = 0
+        self.updates = 0
+        # Offer ids in ascending order and the row of each
+        self._ids = array("q")
+        self._id_rows = array("q")
+        # Offers added since the load, by id and by product
+        self._tail: Dict[int, OfferRow] = {}
+        self._tail_by_product: Dict[int, Set[int]] = {}
+        # Changes committed while a reload runs, replayed onto the new data
+        self._pending: Optional[List[Tuple[List[OfferRow], Dict[int, int], Dict[int, bool]]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.offer_id) + len(self._tail)
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def cheapest(self, product_id: int) -> Optional[Dict[str, int]]:
+        """In-stock offer of an active shop with the lowest price, ties go to the lower offer id."""
+        self.lookups += 1
+        best = min(self._offers(product_id), key=lambda row: (row[3], row[0]), default=None)
+        return None if best is None else dict(zip(("product_info_id", *COLUMNS[1:]), best))
+
+    def price_range(self, product_id: int) -> Optional[Dict[str, int]]:
+        """Lowest and highest price of a product over in-stock offers of active shops."""
+        self.lookups += 1
+        prices = [row[3] for row in self._offers(product_id)]
+        if not prices:
+            return None
+        return {"product_id": product_id,
+                "min_price": min(prices),
+                "max_price": max(prices),
+                "offers": len(prices),
+                }
+
+    def apply(self, rows: Iterable[OfferRow] = (), quantities: Optional[Dict[int, int]] = None,
+              shops: Optional[Dict[int, bool]] = None):
+        """
+        Apply committed changes.
+
+        :param rows: Full rows of new or changed offers.
+        :param quantities: New quantities of offers by id.
+        :param shops: New states of shops by id.
+        """
+        if not self.loaded and self._pending is None:
+            return
+        rows = list(rows)
+        quantities = quantities or {}
+        shops = shops or {}
+        if self._pending is not None:
+            self._pending.append((rows, quantities, shops))
+        for row in rows:
+            self._upsert(row)
+        for offer_id, quantity in quantities.items():
+            tail_row = self._tail.get(offer_id)
+            if tail_row is not None:
+                self._tail[offer_id] = (*tail_row[:5], quantity)
+                continue
+            position = self._row(offer_id)
+            if position is not None:
+                self.quantity[position] = quantity
+        for shop_id, state in shops.items():
+            if state is False:
+                self.active_shops.discard(shop_id)
+            else:
+                self.active_shops.add(shop_id)
+        self.updates += len(rows) + len(quantities)
+
+    def apply_on_commit(self, session: AsyncSession, rows: Iterable[OfferRow] = (),
+                        quantities: Optional[Dict[int, int]] = None, shops: Optional[Dict[int, bool]] = None):
+        """Apply the changes once the session's current transaction commits."""
+        event.listen(session.sync_session, "after_commit",
+                     lambda _: self.apply(rows, quantities, shops), once=True)
+
+    def _offers(self, product_id: int) -> Iterator[OfferRow]:
+        """In-stock offers of active shops for a product."""
+        start = bisect_left(self.product_id, product_id)
+        for row in range(start, bisect_right(self.product_id, product_id, start)):
+            if self.quantity[row] > 0 and self.shop_id[row] in self.active_shops:
+                yield tuple(getattr(self, column)[row] for column in COLUMNS)
+        for offer_id in self._tail_by_product.get(product_id, ()):
+            row = self._tail[offer_id]
+            if row[5] > 0 and row[2] in self.active_shops:
+                yield row
+
+    def _row(self, offer_id: int) -> Optional[int]:
+        position = bisect_left(self._ids, offer_id)
+        if position < len(self._ids) and self._ids[position] == offer_id:
+            return self._id_rows[position]
+        return None
+
+    def _upsert(self, row: OfferRow):
+        offer_id, product_id = row[0], row[1]
+        tail_row = self._tail.get(offer_id)
+        if tail_row is None:
+            position = self._row(offer_id)
+            if position is not None and self.product_id[position] == product_id:
+                for column, value in zip(COLUMNS, row):
+                    getattr(self, column)[position] = value
+                return
+            if position is not None:
+                # The arrays stay sorted by product, hide the row and keep the offer in the tail
+                self.quantity[position] = 0
+            elif row[5] <= 0:
+                return
+        elif tail_row[1] != product_id:
+            self._tail_by_product[tail_row[1]].discard(offer_id)
+        self._tail[offer_id] = row
+        self._tail_by_product.setdefault(product_id, set()).add(offer_id)
+
+    async def reload(self, session: AsyncSession):
+        """Replace the contents with in-stock offers and active shops read from the database."""
+        started = time.perf_counter()
+        self._pending = []
+        try:
+            fresh = OfferIndex()
+            result = await session.execute(select(Shop.id).where(Shop.state.is_not(False)))
+            fresh.active_shops = set(result.scalars())
+            await fresh._load(session)
+            pending = self._pending
+        finally:
+            self._pending = None
+        for column in (*COLUMNS, "_ids", "_id_rows", "_tail", "_tail_by_product"):
+            setattr(self, column, getattr(fresh, column))
+        self.active_shops = fresh.active_shops
+        self.loaded_at = time.time()
+        for rows, quantities, shops in pending:
+            self.apply(rows, quantities, shops)
+        self.load_seconds = time.perf_counter() - started
+
+    async def _load(self, session: AsyncSession):
+        # Rows arrive in product order, the window columns place each offer in the id order
+        query = (select(ProductInfo.id, ProductInfo.product_id, ProductInfo.shop_id, ProductInfo.price,
+                        ProductInfo.price_rrc, ProductInfo.quantity,
+                        func.row_number().over(order_by=ProductInfo.id) - 1,
+                        func.count().over())
+                 .where(ProductInfo.quantity > 0, ProductInfo.product_id.is_not(None))
+                 .order_by(ProductInfo.product_id, ProductInfo.id)
+                 .execution_options(yield_per=10000))
+        result = await session.stream(query)
+        position = 0
+        async for row in result:
+            if position == 0:
+                size = row[7]
+                for column in (*COLUMNS, "_ids", "_id_rows"):
+                    setattr(self, column, _zeros(size))
+            for column, value in zip(COLUMNS, row):
+                getattr(self, column)[position] = value or 0
+            self._ids[row[6]] = row[0]
+            self._id_rows[row[6]] = position
+            position += 1
+
+    async def start(self, session_maker: sessionmaker, interval: float = OFFER_INDEX_REFRESH_INTERVAL):
+        async with session_maker() as session:
+            await self.reload(session)
+        self._task = asyncio.create_task(self._refresh(session_maker, interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh(self, session_maker: sessionmaker, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with session_maker() as session:
+                    await self.reload(session)
+            except Exception:
+                logger.exception("Offer index reload failed, keeping the previous data")
+
+    def stats(self) -> Dict[str, Any]:
+        column_bytes = sum(len(getattr(self, column)) * getattr(self, column).itemsize
+                           for column in (*COLUMNS, "_ids", "_id_rows"))
+        return {"offers": len(self),
+                "tail_offers": len(self._tail),
+                "active_shops": len(self.active_shops),
+                "column_bytes": column_bytes,
+                "loaded_at": self.loaded_at,
+                "load_seconds": self.load_seconds,
+                "lookups": self.lookups,
+                "updates": self.updates,
+                }
+
+
+offer_index = OfferIndex()
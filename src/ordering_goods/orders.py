@@ -0,0 +1,194 @@
+"""
+Basket and checkout.
+
+The basket is the user's single order in the ``basket`` state. Checkout
+reserves stock for all of its items in one transaction: the offers are
+locked in ``product_info.id`` order, so concurrent checkouts over the same
+SKUs queue up instead of deadlocking, and each one is decremented with a
+conditional ``UPDATE ... RETURNING`` so stock can never go negative.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, Select, column, delete, func, literal, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.models import Contact, Order, OrderItem, OrderStateEnum, ProductInfo
+from src.ordering_goods.facets import adjust_facets
+from src.ordering_goods.offer_index import offer_index
+from src.ordering_goods.schemas import BasketItem
+
+
+class CheckoutError(Exception):
+    detail = "Checkout failed"
+
+
+class EmptyBasket(CheckoutError):
+    detail = "Basket is empty"
+
+
+class UnknownContact(CheckoutError):
+    detail = "Contact not found"
+
+
+class OutOfStock(CheckoutError):
+
+    def __init__(self, product_info_ids: List[int]):
+        super().__init__(product_info_ids)
+        self.product_info_ids = product_info_ids
+        self.detail = f"Not enough stock for offers {product_info_ids}"
+
+
+class UnknownOffer(Exception):
+
+    def __init__(self, product_info_ids: List[int]):
+        super().__init__(product_info_ids)
+        self.product_info_ids = product_info_ids
+        self.detail = f"Offers {product_info_ids} not found"
+
+
+async def get_basket_id(session: AsyncSession, user_id: int, create: bool = True) -> Optional[int]:
+    query = select(Order.id).where(Order.user_id == user_id, Order.state == OrderStateEnum.BASKET.value)
+    basket_id = (await session.execute(query)).scalar_one_or_none()
+    if basket_id is None and create:
+        stmt = insert(Order).values(user_id=user_id, state=OrderStateEnum.BASKET.value)
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Order.user_id],
+                                           index_where=Order.state == OrderStateEnum.BASKET.value,
+                                           ).returning(Order.id)
+        basket_id = (await session.execute(stmt)).scalar_one_or_none()
+        if basket_id is None:
+            # Created by a concurrent request
+            basket_id = (await session.execute(query)).scalar_one()
+    return basket_id
+
+
+async def get_basket_items(session: AsyncSession, basket_id: int) -> List[Dict[str, Any]]:
+    query = (select(OrderItem.product_info_id, OrderItem.quantity, ProductInfo.price, ProductInfo.model)
+             .join(ProductInfo, OrderItem.product_info_id == ProductInfo.id)
+             .where(OrderItem.order_id == basket_id)
+             .order_by(OrderItem.product_info_id)
+             )
+    result = await session.execute(query)
+    return [dict(row._mapping) for row in result]
+
+
+async def put_basket_items(session: AsyncSession, basket_id: int, items: List[BasketItem]):
+    """
+    Set item quantities of the basket with a single multi-row upsert.
+
+    Items are joined with their offers in the same statement, so unknown
+    offers are left out instead of failing on the foreign key.
+
+    :raises UnknownOffer: Some offers do not exist, the caller must roll back.
+    """
+    quantities = {item.product_info_id: item.quantity for item in items}
+    if not quantities:
+        return
+    wanted = values(column("product_info_id", Integer), column("quantity", Integer), name="wanted").data(
+        list(quantities.items()))
+    rows = (select(literal(basket_id), wanted.c.product_info_id, wanted.c.quantity)
+            .join(ProductInfo, ProductInfo.id == wanted.c.product_info_id))
+    stmt = insert(OrderItem).from_select(["order_id", "product_info_id", "quantity"], rows)
+    stmt = stmt.on_conflict_do_update(index_elements=[OrderItem.order_id, OrderItem.product_info_id],
+                                      set_={"quantity": stmt.excluded.quantity},
+                                      ).returning(OrderItem.product_info_id)
+    result = await session.execute(stmt)
+    unknown = quantities.keys() - set(result.scalars())
+    if unknown:
+        raise UnknownOffer(sorted(unknown))
+
+
+async def remove_basket_items(session: AsyncSession, basket_id: int, product_info_ids: List[int]):
+    await session.execute(delete(OrderItem).where(OrderItem.order_id == basket_id,
+                                                  OrderItem.product_info_id.in_(product_info_ids)))
+
+
+def order_history_query(user_id: int, after: Optional[int] = None) -> Select:
+    """
+    Orders of the user, newest first, with totals summed in the database.
+
+    Keyset-paginated on ``(dt_at, id)``: ``after`` is the id of the last order
+    of the previous page, its ``dt_at`` is looked up in the same statement.
+    """
+    query = (select(Order.id, Order.dt_at, Order.state,
+                    func.count(OrderItem.product_info_id).label("items"),
+                    func.coalesce(func.sum(OrderItem.quantity), 0).label("quantity"),
+                    func.coalesce(func.sum(OrderItem.quantity * ProductInfo.price), 0).label("total"))
+             .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+             .outerjoin(ProductInfo, OrderItem.product_info_id == ProductInfo.id)
+             .where(Order.user_id == user_id, Order.state != OrderStateEnum.BASKET.value)
+             .group_by(Order.id)
+             .order_by(Order.dt_at.desc(), Order.id.desc()))
+    if after is not None:
+        after_dt_at = (select(Order.dt_at)
+                       .where(Order.id == after, Order.user_id == user_id)
+                       .scalar_subquery())
+        query = query.where(tuple_(Order.dt_at, Order.id) < tuple_(after_dt_at, after))
+    return query
+
+
+async def checkout(session: AsyncSession, user_id: int, contact_id: int) -> int:
+    """
+    Turn the user's basket into a new order and reserve its stock.
+
+    Everything happens in the session's transaction and is committed on
+    success; on any error the transaction is rolled back.
+
+    :raises CheckoutError: The basket is empty, the contact is not the user's,
+    or some offer does not have enough stock.
+    :return: Id of the new order.
+    """
+    try:
+        order_id = await _reserve(session, user_id, contact_id)
+    except BaseException:
+        await session.rollback()
+        raise
+    await session.commit()
+    return order_id
+
+
+async def _reserve(session: AsyncSession, user_id: int, contact_id: int) -> int:
+    contact = await session.execute(select(Contact.id).where(Contact.id == contact_id,
+                                                             Contact.user_id == user_id))
+    if contact.scalar_one_or_none() is None:
+        raise UnknownContact()
+
+    basket = await session.execute(select(Order.id)
+                                   .where(Order.user_id == user_id, Order.state == OrderStateEnum.BASKET.value)
+                                   .with_for_update())
+    order_id = basket.scalar_one_or_none()
+    if order_id is None:
+        raise EmptyBasket()
+    items = await session.execute(select(OrderItem.product_info_id, OrderItem.quantity)
+                                  .where(OrderItem.order_id == order_id)
+                                  .order_by(OrderItem.product_info_id))
+    requested = {product_info_id: quantity for product_info_id, quantity in items}
+    if not requested:
+        raise EmptyBasket()
+
+    # Lock in a global order first, the UPDATE below would lock rows in plan order
+    await session.execute(select(ProductInfo.id)
+                          .where(ProductInfo.id.in_(list(requested)))
+                          .order_by(ProductInfo.id)
+                          .with_for_update())
+    wanted = values(column("id", Integer), column("quantity", Integer), name="wanted").data(
+        list(requested.items()))
+    reserved = await session.execute(update(ProductInfo)
+                                     .where(ProductInfo.id == wanted.c.id,
+                                            ProductInfo.quantity >= wanted.c.quantity)
+                                     .values(quantity=ProductInfo.quantity - wanted.c.quantity)
+                                     .returning(ProductInfo.id, ProductInfo.quantity)
+                                     .execution_options(synchronize_session=False))
+    remaining = {product_info_id: quantity for product_info_id, quantity in reserved}
+    if len(remaining) < len(requested):
+        raise OutOfStock(sorted(requested.keys() - remaining.keys()))
+
+    await session.execute(update(Order)
+                          .where(Order.id == order_id)
+                          .values(state=OrderStateEnum.NEW.value, contact_id=contact_id, dt_at=datetime.utcnow()))
+    await adjust_facets(session,
+                        removed=[product_info_id for product_info_id, quantity in remaining.items()
+                                 if quantity == 0])
+    offer_index.apply_on_commit(session, quantities=remaining)
+    return order_id
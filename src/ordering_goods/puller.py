@@ -0,0 +1,265 @@
+"""
+Scheduled pulling of price lists from ``Shop.url``.
+
+Every ``PULL_INTERVAL`` seconds the price list of each active shop with a
+URL is fetched, at most ``PULL_CONCURRENCY`` at a time. Requests to one host
+are limited to ``PULL_PER_HOST`` at a time, and started at least
+``PULL_HOST_DELAY`` seconds apart. The ETag and Last-Modified of the last
+imported list are sent back as If-None-Match/If-Modified-Since, so an
+unchanged list costs a 304 and no import. Changed lists are downloaded to a
+temporary file and the download slot is released; the file is then parsed
+on the ``price_list_parser`` process pool, so the event loop is never
+blocked, and written by at most ``PULL_CONCURRENCY`` imports at a time.
+
+Validators live in memory, after a restart every list is fetched once in
+full; the incremental importer keeps that cheap. Enable pulling
+(``PULL_ENABLED``) in one process only.
+
+Shop URLs are supplied by users, so only http(s) URLs whose host resolves
+to public addresses are fetched, and redirects are followed by hand with
+every hop checked the same way. Errors kept for ``/metrics`` name the
+failure without the remote server's text.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import IO, Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from src.config import (PULL_ALLOW_PRIVATE, PULL_CONCURRENCY, PULL_HOST_DELAY, PULL_INTERVAL, PULL_MAX_BYTES,
+                        PULL_MAX_REDIRECTS, PULL_PER_HOST, PULL_TIMEOUT)
+from src.database import async_session_maker
+from src.db.models import Shop
+from src.ordering_goods.bulk_import import import_price_list_file
+
+logger = logging.getLogger(__name__)
+
+
+class PriceListTooLarge(Exception):
+    pass
+
+
+class PullRefused(Exception):
+    """The price list URL is not one the puller may fetch."""
+
+
+async def check_url(url: str, allow_private: bool = False):
+    """
+    Make sure a URL is http(s) and its host resolves to public addresses only.
+
+    :raises PullRefused: The URL must not be fetched.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise PullRefused(f"Only http and https URLs are pulled, not {url!r}")
+    if allow_private:
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, ValueError) as error:
+        raise PullRefused(f"Cannot resolve {parts.hostname!r}") from error
+    for *_, sockaddr in addresses:
+        try:
+            address = ipaddress.ip_address(sockaddr[0])
+        except ValueError:
+            address = None
+        if address is None or not address.is_global or address.is_multicast:
+            raise PullRefused(f"{parts.hostname!r} resolves to a non-public address")
+
+
+def describe_error(error: Exception) -> str:
+    """Error summary without text from the remote server."""
+    if isinstance(error, (PullRefused, PriceListTooLarge)):
+        return f"{type(error).__name__}: {error}"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return type(error).__name__
+
+
+@dataclass
+class PullStatus:
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    last_pulled_at: Optional[float] = None
+    last_status: Optional[str] = None
+    last_error: Optional[str] = None
+
+
+class PriceListPuller:
+
+    def __init__(self,
+                 session_maker: sessionmaker,
+                 interval: float = PULL_INTERVAL,
+                 concurrency: int = PULL_CONCURRENCY,
+                 per_host: int = PULL_PER_HOST,
+                 host_delay: float = PULL_HOST_DELAY,
+                 timeout: float = PULL_TIMEOUT,
+                 max_bytes: int = PULL_MAX_BYTES,
+                 max_redirects: int = PULL_MAX_REDIRECTS,
+                 allow_private: bool = PULL_ALLOW_PRIVATE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.session_maker = session_maker
+        self.interval = interval
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+        self.transport = transport
+        self.shops: Dict[int, PullStatus] = {}
+        self.rounds = 0
+        self.fetched = 0
+        self.not_modified = 0
+        self.imported = 0
+        self.failed = 0
+        self.bytes = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._imports = asyncio.Semaphore(concurrency)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_started: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.pull_all()
+            except Exception:
+                logger.exception("Price list pull round failed")
+            await asyncio.sleep(self.interval)
+
+    async def pull_all(self):
+        """Pull the price list of every active shop that has a URL, once."""
+        async with self.session_maker() as session:
+            result = await session.execute(select(Shop.id, Shop.name, Shop.url)
+                                           .where(Shop.state.is_not(False), Shop.url.is_not(None), Shop.url != "")
+                                           .order_by(Shop.id))
+            shops = result.all()
+        async with httpx.AsyncClient(transport=self.transport, timeout=self.timeout, follow_redirects=False,
+                                     limits=httpx.Limits(max_connections=self.concurrency)) as client:
+            await asyncio.gather(*(self.pull(client, shop_id, name, url) for shop_id, name, url in shops))
+        self.rounds += 1
+
+    async def pull(self, client: httpx.AsyncClient, shop_id: int, name: str, url: str):
+        status = self.shops.get(shop_id)
+        if status is None or status.url != url:
+            status = self.shops[shop_id] = PullStatus(url)
+        headers = {}
+        if status.etag:
+            headers["If-None-Match"] = status.etag
+        if status.last_modified:
+            headers["If-Modified-Since"] = status.last_modified
+        host = urlsplit(url).netloc
+        path = None
+        try:
+            async with self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host)):
+                await self._wait_for_host(host)
+                # Taken last, so that shops queueing for a slow host leave the slots to other hosts
+                async with self._slots:
+                    path, validators = await self._fetch(client, url, headers)
+            if path is None:
+                self.not_modified += 1
+                status.last_status = "not_modified"
+                status.last_error = None
+                return
+            async with self._imports, self.session_maker() as session:
+                await import_price_list_file(session, path, shop=name)
+            self.imported += 1
+            status.etag, status.last_modified = validators
+            status.last_status = "imported"
+            status.last_error = None
+        except Exception as error:
+            self.failed += 1
+            status.last_status = "failed"
+            status.last_error = describe_error(error)
+            logger.warning("Pulling price list of shop %s from %s failed: %s", name, url, error)
+        finally:
+            status.last_pulled_at = time.time()
+            if path is not None:
+                os.unlink(path)
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                     ) -> Tuple[Optional[str], Tuple[Optional[str], Optional[str]]]:
+        """
+        Download a price list into a temporary file.
+
+        :return: Path of the file, None if the list is not modified, and the
+        ETag and Last-Modified of the response.
+        :raises PullRefused: The URL or a redirect leads somewhere not allowed.
+        """
+        for _ in range(self.max_redirects + 1):
+            await check_url(url, self.allow_private)
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.is_redirect:
+                    url = str(response.url.join(response.headers["location"]))
+                    continue
+                if response.status_code == 304:
+                    return None, (None, None)
+                response.raise_for_status()
+                fd, path = tempfile.mkstemp(prefix="price-list-", suffix=".yaml")
+                try:
+                    with os.fdopen(fd, "wb") as spool:
+                        await self._download(response, spool)
+                except BaseException:
+                    os.unlink(path)
+                    raise
+                return path, (response.headers.get("etag"), response.headers.get("last-modified"))
+        raise PullRefused(f"More than {self.max_redirects} redirects")
+
+    async def _wait_for_host(self, host: str):
+        """Space request starts to the same host ``host_delay`` seconds apart."""
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            delay = self._host_started.get(host, float("-inf")) + self.host_delay - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._host_started[host] = time.monotonic()
+
+    async def _download(self, response: httpx.Response, spool: IO[bytes]):
+        self.fetched += 1
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise PriceListTooLarge(f"Price list is larger than {self.max_bytes} bytes")
+            spool.write(chunk)
+        self.bytes += size
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rounds": self.rounds,
+                "fetched": self.fetched,
+                "not_modified": self.not_modified,
+                "imported": self.imported,
+                "failed": self.failed,
+                "bytes": self.bytes,
+                "shops": {shop_id: {"url": status.url,
+                                    "last_status": status.last_status,
+                                    "last_error": status.last_error,
+                                    "last_pulled_at": status.last_pulled_at,
+                                    }
+                          for shop_id, status in self.shops.items()},
+                }
+
+
+price_list_puller = PriceListPuller(async_session_maker)
@@ -1,16 +1,38 @@
-from typing import List
+import os
+import tempfile
+from typing import List, Optional
 
+import yaml
 from asyncpg.exceptions import UniqueViolationError
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload, load_only
 
 from src.auth.base_config import current_active_user
-from src.database import get_async_session
-from src.db.models import Shop, Category, User, ShopCategory
-from src.ordering_goods.schemas import ShopRead, ShopCreate, CategoryCreate, CategoryRead
-from src.ordering_goods.utils import create_categories_from_list
+from src.database import get_async_session, get_read_session
+from src.db.models import Shop, Category, User, ShopCategory, UserTypeEnum
+from src.ordering_goods.export import CSV, MEDIA_TYPES, NDJSON, gzip_chunks, offers_query, orders_query, stream_rows
+from src.ordering_goods.facets import get_category_facets
+from src.ordering_goods.bulk_import import import_price_list_file
+from src.ordering_goods.importer import ShopNotOwned
+from src.ordering_goods.names import category_names
+from src.ordering_goods.offer_index import offer_index
+from src.ordering_goods.orders import (CheckoutError, UnknownOffer, checkout, get_basket_id, get_basket_items,
+                                      put_basket_items, remove_basket_items, order_history_query)
+from src.ordering_goods.schemas import (ShopRead, ShopCreate, CategoryCreate, CategoryRead, PriceListImportResult,
+                                       ProductOfferPage, BasketItem, BasketRead, BasketCheckout,
+                                       ShopPage, CategoryPage, CheapestOffer, PriceRange, OrderHistoryPage)
+from src.ordering_goods.versions import (CATEGORIES, SHOPS, bump_catalog_version, get_catalog_version,
+                                         not_modified)
+from src.query_stats import query_budget
+from src.ordering_goods.utils import (create_categories_from_list, category_to_dict, shop_to_dict,
+                                     keyset_page, stream_ndjson, get_all_categories, get_category,
+                                     categories_page, invalidate_categories_on_commit,
+                                     search_offers_query, get_shops_page)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 router_category = APIRouter(
     prefix="/category",
@@ -18,17 +40,40 @@ router_category = APIRouter(
 )
 
 
-@router_category.get("/all")  # , response_model=List[CategoryRead])
-async def get_categories(session: AsyncSession = Depends(get_async_session)):
-    query = select(Category)
-    result = await session.execute(query)
-    return result.all()
+@router_category.get("/all", response_model=CategoryPage, dependencies=[Depends(query_budget(2))])
+async def get_categories(request: Request,
+                         limit: int = Query(100, ge=1, le=1000),
+                         after: Optional[int] = None,
+                         stream: bool = False,
+                         session: AsyncSession = Depends(get_read_session)):
+    version = await get_catalog_version(session, CATEGORIES)
+    if (response := not_modified(request, version)) is not None:
+        return response
+    if stream:
+        query = select(Category).order_by(Category.id)
+        if after is not None:
+            query = query.where(Category.id > after)
+        return StreamingResponse(stream_ndjson(session, query, category_to_dict),
+                                 media_type="application/x-ndjson", headers=version.headers())
+    return ORJSONResponse(categories_page(await get_all_categories(session, version.version), limit, after),
+                          headers=version.headers())
+
+
+@router_category.get("/{category_id}", response_model=CategoryRead)
+async def get_category_by_id(category_id: int, session: AsyncSession = Depends(get_read_session)):
+    category = await get_category(session, category_id)
+    if category is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return category
 
 
 @router_category.post("/")  # , response_model=CategoryRead)
 async def add_category(new_category: CategoryCreate, session: AsyncSession = Depends(get_async_session)):
     create_category = insert(Category).values(**new_category.dict())
     await session.execute(create_category)
+    invalidate_categories_on_commit(session)
+    category_names.remember_on_commit(session, {new_category.name: new_category.id})
+    await bump_catalog_version(session, CATEGORIES)
     try:
         await session.commit()
         return {"status": f"Category {new_category.name} created"}
@@ -42,16 +87,27 @@ router_shop = APIRouter(
 )
 
 
-@router_shop.get("/all")  # , response_model=List[ShopRead])
-async def get_shops(session: AsyncSession = Depends(get_async_session)):
-    query = select(Shop).options(selectinload(Shop.categories),
-                                 load_only(Shop.name, Shop.state, Shop.url),
-                                 )
-    result = await session.execute(query)
-    return result.all()
+@router_shop.get("/all", response_model=ShopPage, dependencies=[Depends(query_budget(3))])
+async def get_shops(request: Request,
+                    limit: int = Query(100, ge=1, le=1000),
+                    after: Optional[int] = None,
+                    stream: bool = False,
+                    session: AsyncSession = Depends(get_read_session)):
+    version = await get_catalog_version(session, SHOPS)
+    if (response := not_modified(request, version)) is not None:
+        return response
+    if stream:
+        query = select(Shop).options(selectinload(Shop.categories),
+                                     load_only(Shop.name, Shop.state, Shop.url, Shop.user_id),
+                                     ).order_by(Shop.id)
+        if after is not None:
+            query = query.where(Shop.id > after)
+        return StreamingResponse(stream_ndjson(session, query, shop_to_dict),
+                                 media_type="application/x-ndjson", headers=version.headers())
+    return ORJSONResponse(await get_shops_page(session, limit, after), headers=version.headers())
 
 
-@router_shop.post("/", status_code=201)
+@router_shop.post("/", status_code=201, dependencies=[Depends(query_budget(5))])
 async def add_shop(new_shop: ShopCreate,
                    session: AsyncSession = Depends(get_async_session)):
                    # user: User = Depends(current_active_user)):
@@ -62,11 +118,193 @@ async def add_shop(new_shop: ShopCreate,
                                     # user_id=user.id,
                                     ).returning(Shop.id)
     result = await session.execute(stmt_shop)
-    await session.commit()
     shop_id = result.scalar_one()
-    for category in categories:
-        stmt = insert(ShopCategory).values(shop_id=shop_id,
-                                           category_id=category["id"])
+    category_ids = {category["id"] for category in categories}
+    if category_ids:
+        stmt = insert(ShopCategory).values([{"shop_id": shop_id, "category_id": category_id}
+                                            for category_id in category_ids])
         await session.execute(stmt)
+    await bump_catalog_version(session, SHOPS, CATEGORIES)
     await session.commit()
     return {"status": f"Shop {new_shop.name} created"}
+
+
+def shop_owner(user: User = Depends(current_active_user)) -> User:
+    if user.usertype != UserTypeEnum.SHOP.value:
+        raise HTTPException(status_code=403, detail="Only shop users are allowed")
+    return user
+
+
+@router_shop.post("/import", status_code=201, response_model=PriceListImportResult)
+async def import_shop_price_list(price_list: UploadFile,
+                                 user: User = Depends(shop_owner),
+                                 session: AsyncSession = Depends(get_async_session)):
+    # Parsed in another process, which needs the upload as a file of its own
+    fd, path = tempfile.mkstemp(prefix="price-list-", suffix=".yaml")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await price_list.read(UPLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+        return await import_price_list_file(session, path, owner_id=user.id)
+    except ShopNotOwned as error:
+        raise HTTPException(status_code=403, detail=str(error))
+    except (ValueError, yaml.YAMLError) as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    finally:
+        os.unlink(path)
+
+
+def export_response(session: AsyncSession, query, name: str, format: str, gzip: bool) -> StreamingResponse:
+    chunks = stream_rows(session, query, format)
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+@router_shop.get("/export/offers")
+async def export_offers(format: str = Query(CSV, regex=f"^({CSV}|{NDJSON})$"),
+                        gzip: bool = False,
+                        user: User = Depends(shop_owner),
+                        session: AsyncSession = Depends(get_read_session)):
+    return export_response(session, offers_query(user.id), "offers", format, gzip)
+
+
+@router_shop.get("/export/orders")
+async def export_orders(format: str = Query(CSV, regex=f"^({CSV}|{NDJSON})$"),
+                        gzip: bool = False,
+                        user: User = Depends(shop_owner),
+                        session: AsyncSession = Depends(get_read_session)):
+    return export_response(session, orders_query(user.id), "orders", format, gzip)
+
+
+router_product = APIRouter(
+    prefix="/product",
+    tags=["Product"]
+)
+
+
+@router_product.get("/facets")
+async def get_facets(category_id: int,
+                     filter: List[str] = Query([], description="parameter_id:value, may be repeated"),
+                     session: AsyncSession = Depends(get_read_session)):
+    filters = []
+    for item in filter:
+        parameter_id, _, value = item.partition(":")
+        if not parameter_id.isdigit() or not value:
+            raise HTTPException(status_code=422, detail=f"Invalid filter {item!r}, expected parameter_id:value")
+        filters.append((int(parameter_id), value))
+    return await get_category_facets(session, category_id, filters)
+
+
+@router_product.get("/search", response_model=ProductOfferPage,
+                    dependencies=[Depends(query_budget(1))])
+async def search_products(q: Optional[str] = Query(None, max_length=100),
+                          category_id: Optional[int] = None,
+                          shop_id: Optional[int] = None,
+                          price_min: Optional[int] = Query(None, ge=0),
+                          price_max: Optional[int] = Query(None, ge=0),
+                          in_stock: bool = False,
+                          limit: int = Query(50, ge=1, le=500),
+                          after: Optional[int] = None,
+                          session: AsyncSession = Depends(get_read_session)):
+    query = search_offers_query(q, category_id, shop_id, price_min, price_max, in_stock, after)
+    result = await session.execute(query.limit(limit))
+    return keyset_page(result.all(), limit, lambda row: dict(row._mapping))
+
+
+def _loaded_offer_index():
+    if not offer_index.loaded:
+        raise HTTPException(status_code=503, detail="Offer index is loading")
+    return offer_index
+
+
+@router_product.get("/{product_id}/cheapest", response_model=CheapestOffer,
+                    dependencies=[Depends(query_budget(0))])
+async def get_cheapest_offer(product_id: int):
+    """
+    Cheapest in-stock offer from the offer index.
+
+    Imports and checkouts of other worker processes show up after up to
+    ``OFFER_INDEX_REFRESH_INTERVAL`` seconds.
+    """
+    offer = _loaded_offer_index().cheapest(product_id)
+    if offer is None:
+        raise HTTPException(status_code=404, detail="No offer in stock")
+    return ORJSONResponse(offer)
+
+
+@router_product.get("/{product_id}/price-range", response_model=PriceRange,
+                    dependencies=[Depends(query_budget(0))])
+async def get_price_range(product_id: int):
+    """
+    Price range of in-stock offers from the offer index.
+
+    Imports and checkouts of other worker processes show up after up to
+    ``OFFER_INDEX_REFRESH_INTERVAL`` seconds.
+    """
+    price_range = _loaded_offer_index().price_range(product_id)
+    if price_range is None:
+        raise HTTPException(status_code=404, detail="No offer in stock")
+    return ORJSONResponse(price_range)
+
+
+router_order = APIRouter(
+    prefix="/order",
+    tags=["Order"]
+)
+
+
+@router_order.get("/history", response_model=OrderHistoryPage, dependencies=[Depends(query_budget(1))])
+async def get_order_history(limit: int = Query(20, ge=1, le=100),
+                            after: Optional[int] = None,
+                            user: User = Depends(current_active_user),
+                            session: AsyncSession = Depends(get_async_session)):
+    result = await session.execute(order_history_query(user.id, after).limit(limit))
+    return keyset_page(result.all(), limit, lambda row: dict(row._mapping))
+
+
+@router_order.get("/basket", response_model=BasketRead)
+async def get_basket(user: User = Depends(current_active_user),
+                     session: AsyncSession = Depends(get_async_session)):
+    basket_id = await get_basket_id(session, user.id, create=False)
+    if basket_id is None:
+        return {"id": None, "items": []}
+    return {"id": basket_id, "items": await get_basket_items(session, basket_id)}
+
+
+@router_order.put("/basket")
+async def put_basket(items: List[BasketItem],
+                     user: User = Depends(current_active_user),
+                     session: AsyncSession = Depends(get_async_session)):
+    basket_id = await get_basket_id(session, user.id)
+    try:
+        await put_basket_items(session, basket_id, items)
+    except UnknownOffer as error:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail=error.detail)
+    await session.commit()
+    return {"status": f"{len(items)} items put into basket {basket_id}"}
+
+
+@router_order.delete("/basket")
+async def delete_from_basket(product_info_id: List[int] = Query(...),
+                             user: User = Depends(current_active_user),
+                             session: AsyncSession = Depends(get_async_session)):
+    basket_id = await get_basket_id(session, user.id, create=False)
+    if basket_id is not None:
+        await remove_basket_items(session, basket_id, product_info_id)
+        await session.commit()
+    return {"status": "Items removed from basket"}
+
+
+@router_order.post("/basket/checkout", status_code=201, dependencies=[Depends(query_budget(10))])
+async def checkout_basket(data: BasketCheckout,
+                          user: User = Depends(current_active_user),
+                          session: AsyncSession = Depends(get_async_session)):
+    try:
+        order_id = await checkout(session, user.id, data.contact_id)
+    except CheckoutError as error:
+        raise HTTPException(status_code=409, detail=error.detail)
+    return {"status": f"Order {order_id} created", "order_id": order_id}
@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 
-from pydantic import BaseModel, constr, NonNegativeInt, Field
+from pydantic import BaseModel, constr, NonNegativeInt, PositiveInt, Field
 
 from src.auth.schemas import UserRead
 # from src.db.models import User, ProductInfo, Category, Shop, Product
@@ -41,6 +41,16 @@ class ShopRead(ShopCreate):
     categories: List[CategoryCreate]
 
 
+class ShopPage(BaseModel):
+    items: List[ShopRead]
+    next_after: Optional[int]
+
+
+class CategoryPage(BaseModel):
+    items: List[CategoryRead]
+    next_after: Optional[int]
+
+
 class ShopUpdate(ShopCreate):
     name: Optional[constr(max_length=50)]
     url: Optional[str]
@@ -145,3 +155,94 @@ class OrderRead(OrderCreate):
 class OrderUpdate(OrderCreate):
     state: Optional[constr(max_length=10)]
     contact_id: Optional[int]
+
+
+class PriceListGood(BaseModel):
+    id: NonNegativeInt
+    category: int
+    model: constr(max_length=80)
+    name: constr(max_length=80)
+    price: NonNegativeInt
+    price_rrc: NonNegativeInt
+    quantity: NonNegativeInt
+    parameters: Dict[constr(max_length=40), constr(max_length=100)] = {}
+
+
+class PriceListImportResult(BaseModel):
+    shop: str
+    goods: int
+    new: int
+    changed: int
+    unchanged: int
+    removed: int
+    duplicates: int
+    rows: int
+    seconds: float
+    rows_per_second: float
+
+
+class ProductOfferRead(BaseModel):
+    id: int
+    product_id: int
+    name: str
+    category_id: int
+    shop_id: int
+    model: str
+    external_id: int
+    quantity: int
+    price: int
+    price_rrc: int
+
+
+class CheapestOffer(BaseModel):
+    product_info_id: int
+    product_id: int
+    shop_id: int
+    price: int
+    price_rrc: int
+    quantity: int
+
+
+class PriceRange(BaseModel):
+    product_id: int
+    min_price: int
+    max_price: int
+    offers: int
+
+
+class ProductOfferPage(BaseModel):
+    items: List[ProductOfferRead]
+    next_after: Optional[int]
+
+
+class BasketItem(BaseModel):
+    product_info_id: int
+    quantity: PositiveInt
+
+
+class BasketItemRead(BasketItem):
+    price: int
+    model: str
+
+
+class OrderHistoryItem(BaseModel):
+    id: int
+    dt_at: datetime
+    state: str
+    items: int
+    quantity: int
+    total: int
+
+
+class OrderHistoryPage(BaseModel):
+    items: List[OrderHistoryItem]
+    next_after: Optional[int]
+
+
+class BasketRead(BaseModel):
+    id: Optional[int]
+    items: List[BasketItemRead]
+
+
+class BasketCheckout(BaseModel):
+    contact_id: int
@@ -1,16 +1,78 @@
-from typing import List
+from bisect import bisect_right
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
-from sqlalchemy import insert, select
-from sqlalchemy.exc import IntegrityError
+import orjson
+from sqlalchemy import Select, event, insert, select, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db.models import Category
+from src.cache import TTLCache
+from src.config import CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL
+from src.database import primary_session
+from src.db.models import Category, Product, ProductInfo, ProductParameter, Shop, ShopCategory
+from src.ordering_goods.names import category_names
 from src.ordering_goods.schemas import CategoryCreate
+from src.ordering_goods.versions import CATEGORIES, bump_catalog_version
+
+category_cache = TTLCache(maxsize=CATEGORY_CACHE_SIZE, ttl=CATEGORY_CACHE_TTL)
+ALL_CATEGORIES = "all"
+
+
+def invalidate_categories_on_commit(session: AsyncSession):
+    """Drop the category cache once the session's current transaction commits."""
+    event.listen(session.sync_session, "after_commit", lambda _: category_cache.clear(), once=True)
+
+
+async def get_all_categories(session: AsyncSession, min_version: int = 0) -> List[Dict[str, Any]]:
+    """
+    Return all categories ordered by id, from the cache when possible, else from the primary.
+
+    :param min_version: Catalog version the categories must be at least as new as. A list
+    read after the version was seen qualifies, so it is cached with that version.
+    """
+    cached = category_cache.get(ALL_CATEGORIES)
+    if cached is not None and cached[0] >= min_version:
+        return cached[1]
+    generation = category_cache.generation
+    async with primary_session(session) as primary:
+        result = await primary.execute(select(Category).order_by(Category.id))
+        categories = [category_to_dict(category) for category in result.scalars()]
+    # Not if a commit invalidated the cache while the categories were read
+    if category_cache.generation == generation:
+        category_cache.set(ALL_CATEGORIES, (min_version, categories))
+    return categories
+
+
+async def get_category(session: AsyncSession, category_id: int) -> Optional[Dict[str, Any]]:
+    category = category_cache.get(category_id)
+    if category is None:
+        generation = category_cache.generation
+        async with primary_session(session) as primary:
+            result = await primary.execute(select(Category).where(Category.id == category_id))
+            found = result.scalar_one_or_none()
+        if found is None:
+            return None
+        category = category_to_dict(found)
+        if category_cache.generation == generation:
+            category_cache.set(category_id, category)
+    return category
+
+
+def categories_page(categories: List[Dict[str, Any]], limit: int, after: Optional[int] = None) -> Dict[str, Any]:
+    """Slice a keyset page out of the cached, id-ordered category list."""
+    start = 0 if after is None else bisect_right(categories, after, key=lambda category: category["id"])
+    items = categories[start:start + limit]
+    return {"items": items,
+            "next_after": items[-1]["id"] if len(items) == limit else None,
+            }
 
 
 async def create_category(session: AsyncSession, category: CategoryCreate):
     stmt = insert(Category).values(**category.dict())
     await session.execute(stmt)
+    invalidate_categories_on_commit(session)
+    category_names.remember_on_commit(session, {category.name: category.id})
+    await bump_catalog_version(session, CATEGORIES)
     await session.commit()
 
     return {"status": f"Category {category.name} created"}
@@ -19,17 +81,146 @@ async def create_category(session: AsyncSession, category: CategoryCreate):
 async def create_categories_from_list(session: AsyncSession,
                                       categories: List[CategoryCreate],
                                       ):
-    # user):
-    category_list = []
-    for category in categories:
-        stmt = insert(Category).values(**category)
-        await session.execute(stmt)
-        try:
-            await session.commit()
-        except IntegrityError:
-            continue
-    for category in categories:
-        query = select(Category).where(Category.id == category["id"])
-        result = await session.execute(query)
-        category_list.append(result.unique().scalar_one())
-    return category_list
+    """
+    Insert missing categories with one multi-row upsert and return all of them.
+
+    The caller owns the transaction, nothing is committed here.
+    """
+    if not categories:
+        return []
+    await session.execute(pg_insert(Category).values(categories).on_conflict_do_nothing())
+    invalidate_categories_on_commit(session)
+    query = select(Category).where(Category.id.in_([category["id"] for category in categories]))
+    result = await session.execute(query)
+    found = result.scalars().all()
+    category_names.remember_on_commit(session, {category.name: category.id for category in found})
+    return found
+
+
+def category_to_dict(category: Category) -> Dict[str, Any]:
+    return {"id": category.id, "name": category.name}
+
+
+def shop_to_dict(shop: Shop) -> Dict[str, Any]:
+    return {"id": shop.id,
+            "name": shop.name,
+            "url": shop.url,
+            "state": shop.state,
+            "user_id": shop.user_id,
+            "categories": [category_to_dict(category) for category in shop.categories],
+            }
+
+
+async def get_shops_page(session: AsyncSession, limit: int, after: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build a page of shops with their categories from plain rows.
+
+    Two queries, no ORM instances: rows are turned straight into the dicts
+    that get encoded, which is several times cheaper than loading ``Shop``
+    objects and running them through ``jsonable_encoder``.
+    """
+    query = select(Shop.id, Shop.name, Shop.url, Shop.state, Shop.user_id).order_by(Shop.id).limit(limit)
+    if after is not None:
+        query = query.where(Shop.id > after)
+    shops = [{**row._mapping, "categories": []} for row in await session.execute(query)]
+    if shops:
+        by_id = {shop["id"]: shop for shop in shops}
+        links = await session.execute(select(ShopCategory.shop_id, Category.id, Category.name)
+                                      .join(Category, ShopCategory.category_id == Category.id)
+                                      .where(ShopCategory.shop_id.in_(list(by_id)))
+                                      .order_by(ShopCategory.shop_id, Category.id))
+        for shop_id, category_id, name in links:
+            by_id[shop_id]["categories"].append({"id": category_id, "name": name})
+    return {"items": shops,
+            "next_after": shops[-1]["id"] if len(shops) == limit else None,
+            }
+
+
+def keyset_page(items: List[Any], limit: int, serialize: Callable[[Any], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a page of a keyset-paginated listing.
+
+    ``next_after`` is the id to pass as ``after`` for the next page,
+    or None when this page is the last one.
+    """
+    return {"items": [serialize(item) for item in items],
+            "next_after": items[-1].id if len(items) == limit else None,
+            }
+
+
+async def stream_ndjson(session: AsyncSession,
+                        query: Select,
+                        serialize: Callable[[Any], Dict[str, Any]],
+                        chunk_size: int = 500,
+                        ) -> AsyncIterator[bytes]:
+    """
+    Stream query results as newline-delimited JSON.
+
+    Rows are read from a server-side cursor ``chunk_size`` at a time, so memory
+    use does not depend on the size of the result.
+    """
+    result = await session.stream_scalars(query.execution_options(yield_per=chunk_size))
+    async for partition in result.partitions():
+        yield b"".join(orjson.dumps(serialize(item)) + b"\n" for item in partition)
+
+
+def like_pattern(text: str) -> str:
+    """Escape LIKE wildcards in user input and wrap it for a substring match."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_offers_query(q: Optional[str] = None,
+                        category_id: Optional[int] = None,
+                        shop_id: Optional[int] = None,
+                        price_min: Optional[int] = None,
+                        price_max: Optional[int] = None,
+                        in_stock: bool = False,
+                        after: Optional[int] = None,
+                        ) -> Select:
+    """
+    Build the offer search query, keyset-paginated on ``product_info.id``.
+
+    The text filter looks up matching offer ids in ``product.name``,
+    ``product_info.model`` and ``product_parameter.value`` separately, each on
+    its own trigram index, and joins their union. A single OR across the three
+    tables could use none of them. The other filters use B-tree indexes.
+    """
+    query = (select(ProductInfo.id,
+                    ProductInfo.product_id,
+                    Product.name,
+                    Product.category_id,
+                    ProductInfo.shop_id,
+                    ProductInfo.model,
+                    ProductInfo.external_id,
+                    ProductInfo.quantity,
+                    ProductInfo.price,
+                    ProductInfo.price_rrc,
+                    )
+             .join(Product, ProductInfo.product_id == Product.id)
+             .join(Shop, ProductInfo.shop_id == Shop.id)
+             .where(Shop.state.is_(True))
+             .order_by(ProductInfo.id)
+             )
+    if q:
+        pattern = like_pattern(q)
+        matches = union(select(ProductInfo.id)
+                        .join(Product, ProductInfo.product_id == Product.id)
+                        .where(Product.name.ilike(pattern)),
+                        select(ProductInfo.id).where(ProductInfo.model.ilike(pattern)),
+                        select(ProductParameter.product_info_id).where(ProductParameter.value.ilike(pattern)),
+                        ).subquery("matches")
+        query = query.join(matches, matches.c.id == ProductInfo.id)
+    if category_id is not None:
+        query = query.where(Product.category_id == category_id)
+    if shop_id is not None:
+        query = query.where(ProductInfo.shop_id == shop_id)
+    if price_min is not None:
+        query = query.where(ProductInfo.price >= price_min)
+    if price_max is not None:
+        query = query.where(ProductInfo.price <= price_max)
+    if in_stock:
+        query = query.where(ProductInfo.quantity > 0)
+    if after is not None:
+        query = query.where(ProductInfo.id > after)
+    return query
@@ -0,0 +1,105 @@
+"""
+Catalog version counters for conditional GETs.
+
+Every transaction that changes shops or categories bumps the resource's row
+in ``catalog_version`` right before it commits. Listings send the version as
+``ETag`` and its time as ``Last-Modified``; a client sending the current
+ETag back gets a 304 before any catalog data is read or serialized.
+Versions are cached for ``CATALOG_VERSION_TTL`` seconds and dropped when a
+local transaction bumps them, so most conditional requests run no query.
+
+A version is read from the database the listing is served from, and
+cached per database, before the data: a lagging replica then sends an ETag
+older than its data, never a newer one that a client could keep getting
+304s for.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.config import CATALOG_VERSION_TTL
+from src.db.models import CatalogVersion
+
+SHOPS = "shop"
+CATEGORIES = "category"
+
+# Keyed by (resource, replica name or None for the primary)
+version_cache = TTLCache(maxsize=64, ttl=CATALOG_VERSION_TTL)
+
+
+@dataclass(frozen=True)
+class ResourceVersion:
+    resource: str
+    version: int
+    updated_at: Optional[datetime] = None
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.resource}-{self.version}"'
+
+    def headers(self) -> Dict[str, str]:
+        # no-cache: clients may store the response but must revalidate it
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.updated_at is not None:
+            headers["Last-Modified"] = format_datetime(self.updated_at.astimezone(timezone.utc), usegmt=True)
+        return headers
+
+
+async def get_catalog_version(session: AsyncSession, resource: str) -> ResourceVersion:
+    """Current version of a resource as seen by the session's database, cached per database."""
+    key = (resource, session.info.get("replica"))
+    version = version_cache.get(key)
+    if version is None:
+        generation = version_cache.generation
+        result = await session.execute(select(CatalogVersion.version, CatalogVersion.updated_at)
+                                       .where(CatalogVersion.resource == resource))
+        row = result.one_or_none()
+        version = ResourceVersion(resource, *row) if row is not None else ResourceVersion(resource, 0)
+        if version_cache.generation == generation:
+            version_cache.set(key, version)
+    return version
+
+
+def _invalidate_versions(resources: List[str]):
+    for key in version_cache.keys():
+        if key[0] in resources:
+            version_cache.pop(key)
+
+
+async def bump_catalog_version(session: AsyncSession, *resources: str):
+    """
+    Increment resource versions in the session's transaction.
+
+    The rows stay locked until the transaction ends, so call this right
+    before committing to keep concurrent writers from queueing on them.
+    """
+    resources = sorted(set(resources))
+    stmt = insert(CatalogVersion).values([{"resource": resource, "version": 1} for resource in resources])
+    stmt = stmt.on_conflict_do_update(index_elements=[CatalogVersion.resource],
+                                      set_={"version": CatalogVersion.version + 1, "updated_at": func.now()})
+    await session.execute(stmt)
+    event.listen(session.sync_session, "after_commit", lambda _: _invalidate_versions(resources), once=True)
+
+
+def not_modified(request: Request, version: ResourceVersion) -> Optional[Response]:
+    """Return a 304 response if the client's copy is still current."""
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        current = "*" in tags or version.etag in tags
+    elif if_modified_since is not None and version.updated_at is not None:
+        try:
+            current = version.updated_at.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            current = False
+    else:
+        current = False
+    return Response(status_code=304, headers=version.headers()) if current else None
@@ -0,0 +1,191 @@
+"""
+Per-request SQL statement counting and N+1 detection.
+
+Engine events record every statement into the ``RequestQueries`` of the
+current request, found through a context variable. The middleware reports
+the totals in ``X-Query-Count``/``X-Query-Time-Ms`` headers, aggregates them
+per route for ``/metrics/queries`` and logs statement shapes repeated within
+one request as N+1 candidates.
+
+Statements run while a ``StreamingResponse`` body is sent come after the
+headers: the headers only count the statements run before the response
+started, while the route totals, the budget check and N+1 logging happen
+once the body is complete and include them. A strict budget can only fail
+the request for statements run before the response started, later ones
+are logged.
+
+A request counter also records into the counter that was current when the
+request came in, so ``assert_max_queries`` around an in-process request in
+tests sees every statement of the request.
+
+Routes declare a budget with ``dependencies=[Depends(query_budget(n))]``.
+With ``QUERY_BUDGET_STRICT`` set, as in CI, a route going over its budget
+fails with a 500 instead of just logging a warning. Housekeeping statements
+that a request merely happens to trigger opt out with the
+``count_query=False`` execution option.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import QUERY_BUDGET_STRICT, N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["RequestQueries"]] = ContextVar("request_queries", default=None)
+route_stats: Dict[str, Dict[str, Any]] = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so that executions differing only in parameters compare equal."""
+    shape = re.sub(r"\$\d+|%\(\w+\)s|\?", "?", statement)
+    shape = re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", shape)
+    shape = re.sub(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+", "(?, ...), ...", shape)
+    return " ".join(shape.split())
+
+
+class RequestQueries:
+
+    def __init__(self, parent: Optional["RequestQueries"] = None):
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        self.budget: Optional[int] = None
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        if self.parent is not None:
+            self.parent.record(statement, seconds)
+
+    def n_plus_one(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    queries = _current.get()
+    if queries is not None and (context is None or context.execution_options.get("count_query", True)):
+        queries.record(statement, time.perf_counter() - started)
+
+
+def install_query_counter(engine: AsyncEngine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def query_budget(limit: int) -> Callable[[], None]:
+    """Dependency factory declaring how many statements a route may run."""
+
+    async def set_budget():
+        queries = _current.get()
+        if queries is not None:
+            queries.budget = limit
+
+    return set_budget
+
+
+@contextmanager
+def count_queries() -> Iterator[RequestQueries]:
+    """Count the statements run inside the block, for use in tests and scripts."""
+    queries = RequestQueries()
+    token = _current.set(queries)
+    try:
+        yield queries
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[RequestQueries]:
+    """
+    Fail with ``QueryBudgetExceeded`` if the block runs more than ``limit`` statements.
+
+    In-process requests made in the block are counted including their streamed bodies.
+    """
+    with count_queries() as queries:
+        yield queries
+    if queries.count > limit:
+        raise QueryBudgetExceeded(f"{queries.count} statements run, budget is {limit}: "
+                                  f"{queries.shapes.most_common(5)}")
+
+
+def _route_name(request: Request) -> str:
+    endpoint = request.scope.get("endpoint")
+    for route in request.app.routes:
+        if endpoint is not None and getattr(route, "endpoint", None) is endpoint:
+            return f"{request.method} {route.path}"
+    return f"{request.method} {request.url.path}"
+
+
+def _aggregate(route: str, queries: RequestQueries, candidates: List[Tuple[str, int]]):
+    stats = route_stats.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "seconds": 0.0,
+                                           "over_budget": 0, "n_plus_one": 0})
+    stats["requests"] += 1
+    stats["queries"] += queries.count
+    stats["max_queries"] = max(stats["max_queries"], queries.count)
+    stats["seconds"] += queries.seconds
+    stats["over_budget"] += queries.over_budget
+    stats["n_plus_one"] += bool(candidates)
+
+
+def _report(route: str, queries: RequestQueries):
+    candidates = queries.n_plus_one()
+    _aggregate(route, queries, candidates)
+    for shape, count in candidates:
+        logger.warning("Possible N+1 in %s: %d x %s", route, count, shape)
+    if queries.over_budget:
+        logger.warning("Query budget exceeded: %s ran %d statements, budget is %d",
+                       route, queries.count, queries.budget)
+
+
+async def _report_after(body: AsyncIterator[bytes], route: str, queries: RequestQueries) -> AsyncIterator[bytes]:
+    """Pass the body through and report the request once it has been sent."""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        _report(route, queries)
+
+
+async def query_counter_middleware(request: Request, call_next) -> Response:
+    queries = RequestQueries(parent=_current.get())
+    token = _current.set(queries)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+
+    route = _route_name(request)
+    if queries.over_budget and QUERY_BUDGET_STRICT:
+        _report(route, queries)
+        message = f"{route} ran {queries.count} statements, budget is {queries.budget}"
+        return JSONResponse(status_code=500, content={"detail": f"Query budget exceeded: {message}"})
+    response.headers["X-Query-Count"] = str(queries.count)
+    response.headers["X-Query-Time-Ms"] = f"{queries.seconds * 1000:.2f}"
+    # The body may still run statements, e.g. when it streams rows from a cursor
+    response.body_iterator = _report_after(response.body_iterator, route, queries)
+    return response
@@ -0,0 +1,92 @@
+"""
+The app driven in process through httpx's ASGI transport.
+
+Tests using these fixtures run against the database configured in ``.env``
+with all migrations applied, like the benchmarks. Every session seeds its
+own shop and buyer under a random tag, so runs do not interfere with each
+other. Unit tests that use none of them need no database.
+"""
+import io
+import os
+import sys
+import uuid
+from typing import Any, Dict
+
+import httpx
+import pytest
+from sqlalchemy import insert, select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# src/main.py imports its siblings as top-level packages
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from benchmarks.data import price_list  # noqa: E402
+from src.database import async_session_maker, engine  # noqa: E402
+from src.db.models import Contact, Product, ProductInfo, Shop, User  # noqa: E402
+from src.main import app  # noqa: E402
+from src.ordering_goods.importer import import_price_list  # noqa: E402
+
+PASSWORD = "test-password"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def tag() -> str:
+    return uuid.uuid4().hex[:8]
+
+
+@pytest.fixture(scope="session")
+async def started():
+    await app.router.startup()
+    yield app
+    await app.router.shutdown()
+    await engine.dispose()
+
+
+@pytest.fixture(scope="session")
+async def catalog(started, tag) -> Dict[str, Any]:
+    """An in-stock offer of a freshly imported shop."""
+    shop = f"test-{tag}"
+    async with async_session_maker() as session:
+        await import_price_list(session, io.BytesIO(price_list(shop, 10, 500)))
+        result = await session.execute(select(ProductInfo.id, ProductInfo.product_id, ProductInfo.shop_id,
+                                              ProductInfo.model, Product.category_id)
+                                       .join(Product, ProductInfo.product_id == Product.id)
+                                       .join(Shop, ProductInfo.shop_id == Shop.id)
+                                       .where(Shop.name == shop, ProductInfo.quantity > 0)
+                                       .order_by(ProductInfo.id)
+                                       .limit(1))
+        return dict(result.one()._mapping)
+
+
+@pytest.fixture(scope="session")
+async def client(started):
+    async with httpx.AsyncClient(app=app, base_url="https://test") as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+async def buyer(started, tag) -> Dict[str, Any]:
+    """A logged in buyer with a contact, the auth cookie is only sent over https."""
+    email = f"test-{tag}@example.com"
+    async with httpx.AsyncClient(app=app, base_url="https://test") as client:
+        response = await client.post("/auth/register", json={"email": email,
+                                                             "password": PASSWORD,
+                                                             "username": f"test-{tag}",
+                                                             "company": "test",
+                                                             "position": "test"})
+        assert response.status_code == 201, response.text
+        response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+        assert response.is_success, response.text
+        async with async_session_maker() as session:
+            user_id = (await session.execute(select(User.id).where(User.email == email))).scalar_one()
+            result = await session.execute(insert(Contact).values(user_id=user_id, city="test").returning(Contact.id))
+            contact_id = result.scalar_one()
+            await session.commit()
+        # Resolve the user once, so that tests count what their route runs
+        assert (await client.get("/protected-route")).is_success
+        yield {"client": client, "user_id": user_id, "contact_id": contact_id}
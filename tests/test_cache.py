@@ -0,0 +1,61 @@
+"""
+Expiry, eviction and invalidation generations of ``TTLCache``.
+
+Plain unit tests, no database needed.
+"""
+from src.cache import TTLCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+    cache.set("key", 1)
+    clock.now = 4.9
+    assert cache.get("key") == 1
+    clock.now = 5
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_set_overrides_ttl():
+    clock = Clock()
+    cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+    cache.set("key", 1, ttl=60)
+    clock.now = 30
+    assert cache.get("key") == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=5, timer=Clock())
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.keys() == ["a", "c"]
+
+
+def test_invalidation_changes_generation():
+    cache = TTLCache(maxsize=10, ttl=5, timer=Clock())
+    generation = cache.generation
+    cache.set("key", 1)
+    assert cache.generation == generation
+    cache.pop("key")
+    assert cache.generation != generation
+    generation = cache.generation
+    cache.clear()
+    assert cache.generation != generation
+    # Popping a missing key still counts, the value may be loading right now
+    generation = cache.generation
+    assert cache.pop("missing", "default") == "default"
+    assert cache.generation != generation
+
@@ -0,0 +1,155 @@
+"""
+Lookups and in-place updates of the in-memory offer index.
+
+Plain unit tests, no database needed: the index is loaded from a session
+stand-in that returns rows the way the reload query would.
+"""
+from typing import Callable, List, Optional
+
+import pytest
+
+from src.ordering_goods.offer_index import OfferIndex, OfferRow
+
+pytestmark = pytest.mark.anyio
+
+
+class Rows:
+
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def scalars(self):
+        return iter(self.rows)
+
+    async def __aiter__(self):
+        for row in self.rows:
+            yield row
+
+
+class Snapshot:
+    """Session stand-in answering the reload's two queries from fixed data."""
+
+    def __init__(self, offers: List[OfferRow], shops: List[int], during: Optional[Callable[[], None]] = None):
+        self.offers = offers
+        self.shops = shops
+        self.during = during
+
+    async def execute(self, query):
+        return Rows(self.shops)
+
+    async def stream(self, query):
+        if self.during is not None:
+            # Changes committed while the reload reads its snapshot
+            self.during()
+        offers = [offer for offer in self.offers if offer[5] > 0]
+        by_id = sorted(offer[0] for offer in offers)
+        return Rows([(*offer, by_id.index(offer[0]), len(offers))
+                     for offer in sorted(offers, key=lambda offer: (offer[1], offer[0]))])
+
+
+OFFERS = [
+    # offer id, product id, shop id, price, price_rrc, quantity
+    (5, 1, 1, 100, 110, 3),
+    (2, 1, 2, 90, 99, 1),
+    (9, 2, 1, 50, 55, 2),
+    (7, 3, 1, 10, 11, 1),
+    (8, 3, 2, 10, 11, 0),
+]
+
+
+async def loaded(offers: List[OfferRow] = OFFERS, shops: List[int] = (1, 2)) -> OfferIndex:
+    index = OfferIndex()
+    await index.reload(Snapshot(offers, list(shops)))
+    return index
+
+
+async def test_lookups():
+    index = await loaded()
+    assert index.cheapest(1) == {"product_info_id": 2, "product_id": 1, "shop_id": 2,
+                                 "price": 90, "price_rrc": 99, "quantity": 1}
+    assert index.price_range(1) == {"product_id": 1, "min_price": 90, "max_price": 100, "offers": 2}
+    # Sold out offers are not loaded
+    assert index.price_range(3)["offers"] == 1
+    assert index.cheapest(4) is None
+    assert index.price_range(4) is None
+
+
+async def test_price_ties_go_to_the_lower_offer_id():
+    index = await loaded()
+    index.apply(rows=[(6, 3, 2, 10, 11, 1)])
+    assert index.cheapest(3)["product_info_id"] == 6
+
+
+async def test_inactive_shops_are_skipped():
+    index = await loaded(shops=[1])
+    assert index.cheapest(1)["product_info_id"] == 5
+    index.apply(shops={2: True})
+    assert index.cheapest(1)["product_info_id"] == 2
+    index.apply(shops={2: False})
+    assert index.cheapest(1)["product_info_id"] == 5
+
+
+async def test_quantities_update_rows_in_place():
+    index = await loaded()
+    index.apply(quantities={2: 0})
+    assert index.cheapest(1)["product_info_id"] == 5
+    index.apply(quantities={2: 4})
+    assert index.cheapest(1) == {"product_info_id": 2, "product_id": 1, "shop_id": 2,
+                                 "price": 90, "price_rrc": 99, "quantity": 4}
+    # Unknown offers are ignored
+    index.apply(quantities={404: 1})
+    assert len(index._tail) == 0
+
+
+async def test_changed_row_of_the_same_product_is_updated_in_place():
+    index = await loaded()
+    index.apply(rows=[(5, 1, 1, 80, 88, 3)])
+    assert index.cheapest(1)["product_info_id"] == 5
+    assert len(index._tail) == 0
+
+
+async def test_new_offers_go_to_the_tail():
+    index = await loaded()
+    index.apply(rows=[(11, 1, 2, 70, 77, 4), (12, 4, 1, 30, 33, 1)])
+    assert index.cheapest(1)["product_info_id"] == 11
+    assert index.cheapest(4)["product_info_id"] == 12
+    assert index.stats()["tail_offers"] == 2
+    index.apply(quantities={11: 0})
+    assert index.cheapest(1)["product_info_id"] == 2
+    # A new offer that is sold out already is not added
+    index.apply(rows=[(13, 4, 2, 1, 1, 0)])
+    assert 13 not in index._tail
+
+
+async def test_offer_moved_to_another_product():
+    index = await loaded()
+    index.apply(rows=[(9, 1, 1, 50, 55, 2)])
+    # The loaded row is hidden, the offer lives on in the tail
+    assert index.cheapest(2) is None
+    assert index.cheapest(1)["product_info_id"] == 9
+    # Later updates reach the tail copy, not the hidden row
+    index.apply(quantities={9: 0})
+    assert index.cheapest(1)["product_info_id"] == 2
+    index.apply(rows=[(9, 3, 1, 5, 6, 2)])
+    assert index.price_range(1)["offers"] == 2
+    assert index.cheapest(3)["product_info_id"] == 9
+
+
+async def test_changes_committed_during_a_reload_are_replayed():
+    index = await loaded()
+
+    def commit():
+        index.apply(rows=[(11, 2, 2, 40, 44, 1)], quantities={2: 0})
+
+    # The snapshot predates the commit: it has neither the new offer nor the sale
+    await index.reload(Snapshot(OFFERS, [1, 2], during=commit))
+    assert index.cheapest(2)["product_info_id"] == 11
+    assert index.cheapest(1)["product_info_id"] == 5
+    assert index._pending is None
+
+
+async def test_changes_are_ignored_until_loaded():
+    index = OfferIndex()
+    index.apply(rows=[(11, 1, 2, 70, 77, 4)])
+    assert not index.loaded
+    assert len(index) == 0
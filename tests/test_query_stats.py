@@ -0,0 +1,71 @@
+"""
+Statement shapes, nested counters and budgets of the query counter.
+
+Plain unit tests, no database needed: statements are recorded by hand.
+"""
+import pytest
+
+from src.query_stats import QueryBudgetExceeded, RequestQueries, assert_max_queries, count_queries, statement_shape
+
+
+@pytest.mark.parametrize("statement, shape", [
+    ("SELECT a FROM t WHERE id = $1", "SELECT a FROM t WHERE id = ?"),
+    ("SELECT a FROM t WHERE id = %(id_1)s", "SELECT a FROM t WHERE id = ?"),
+    ("SELECT a\n  FROM t\n WHERE id = ?", "SELECT a FROM t WHERE id = ?"),
+    ("SELECT a FROM t WHERE id IN ($1, $2, $3)", "SELECT a FROM t WHERE id IN (?, ...)"),
+    ("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4), ($5, $6)", "INSERT INTO t (a, b) VALUES (?, ...), ..."),
+])
+def test_statement_shape(statement, shape):
+    assert statement_shape(statement) == shape
+
+
+def test_shape_ignores_number_of_parameters():
+    assert (statement_shape("SELECT a FROM t WHERE id IN ($1, $2)")
+            == statement_shape("SELECT a FROM t WHERE id IN ($1, $2, $3, $4)"))
+    assert (statement_shape("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)")
+            == statement_shape("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4), ($5, $6)"))
+
+
+def test_n_plus_one_candidates():
+    queries = RequestQueries()
+    for number in range(5):
+        queries.record(f"SELECT a FROM t WHERE id = ${number + 1}", 0.001)
+    queries.record("SELECT b FROM u", 0.001)
+    assert queries.count == 6
+    assert queries.n_plus_one(threshold=5) == [("SELECT a FROM t WHERE id = ?", 5)]
+    assert queries.n_plus_one(threshold=6) == []
+
+
+def test_request_counter_records_into_parent():
+    parent = RequestQueries()
+    child = RequestQueries(parent=parent)
+    child.record("SELECT 1", 0.5)
+    assert (child.count, parent.count) == (1, 1)
+    assert parent.seconds == 0.5
+
+
+def test_over_budget():
+    queries = RequestQueries()
+    queries.record("SELECT 1", 0)
+    assert not queries.over_budget
+    queries.budget = 1
+    assert not queries.over_budget
+    queries.record("SELECT 2", 0)
+    assert queries.over_budget
+
+
+def test_assert_max_queries():
+    with assert_max_queries(2) as queries:
+        queries.record("SELECT 1", 0)
+        queries.record("SELECT 2", 0)
+    with pytest.raises(QueryBudgetExceeded):
+        with assert_max_queries(1) as queries:
+            queries.record("SELECT 1", 0)
+            queries.record("SELECT 2", 0)
+
+
+def test_count_queries_restores_outer_counter():
+    with count_queries() as outer:
+        with count_queries() as inner:
+            inner.record("SELECT 1", 0)
+        assert outer.count == 0
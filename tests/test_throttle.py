@@ -0,0 +1,93 @@
+"""
+Token buckets and admission of the auth throttle.
+
+Plain unit tests, no database needed: the clock is injected and requests
+are built from bare ASGI scopes.
+"""
+import pytest
+from fastapi import HTTPException, Request
+
+from src.auth.throttle import AuthThrottle, TokenBucketLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def request(ip: str = "10.0.0.1") -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/auth/login", "headers": [],
+                    "client": (ip, 40000)})
+
+
+def test_bucket_allows_a_burst_then_waits_for_refill():
+    clock = Clock()
+    limiter = TokenBucketLimiter(rate=1, burst=2, timer=clock)
+    assert limiter.acquire("key") == 0
+    assert limiter.acquire("key") == 0
+    assert limiter.acquire("key") == pytest.approx(1)
+    clock.now = 0.5
+    assert limiter.acquire("key") == pytest.approx(0.5)
+    clock.now = 1
+    assert limiter.acquire("key") == 0
+
+
+def test_buckets_are_per_key():
+    limiter = TokenBucketLimiter(rate=1, burst=1, timer=Clock())
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("b") == 0
+
+
+def test_refilled_buckets_expire():
+    clock = Clock()
+    limiter = TokenBucketLimiter(rate=1, burst=2, timer=clock)
+    limiter.acquire("key")
+    clock.now = 2
+    assert limiter.buckets.get("key") is None
+    assert limiter.acquire("key") == 0
+
+
+def test_bucket_count_is_bounded():
+    limiter = TokenBucketLimiter(rate=1, burst=1, maxsize=2, timer=Clock())
+    for key in "abc":
+        limiter.acquire(key)
+    assert len(limiter.buckets) == 2
+
+
+async def test_in_flight_requests_are_capped_until_their_handler_finishes():
+    throttle = AuthThrottle(TokenBucketLimiter(100, 100), TokenBucketLimiter(100, 100), max_in_flight=1)
+    admitted = throttle(request())
+    await admitted.__anext__()
+    assert throttle.in_flight == 1
+    with pytest.raises(HTTPException) as rejected:
+        await throttle(request("10.0.0.2")).__anext__()
+    assert rejected.value.status_code == 429
+    assert throttle.rejected_busy == 1
+    # The handler finished
+    await admitted.aclose()
+    assert throttle.in_flight == 0
+    second = throttle(request("10.0.0.2"))
+    await second.__anext__()
+    await second.aclose()
+    assert (throttle.admitted, throttle.in_flight) == (2, 0)
+
+
+async def test_requests_over_the_ip_rate_are_rejected_with_retry_after():
+    clock = Clock()
+    throttle = AuthThrottle(TokenBucketLimiter(0.5, 1, timer=clock), TokenBucketLimiter(100, 100))
+    admitted = throttle(request())
+    await admitted.__anext__()
+    await admitted.aclose()
+    with pytest.raises(HTTPException) as rejected:
+        await throttle(request()).__anext__()
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers["Retry-After"] == "2"
+    assert throttle.rejected_ip == 1
+    assert throttle.in_flight == 0